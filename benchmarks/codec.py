@@ -0,0 +1,121 @@
+"""
+Decode and encode throughput of the compiled codecs against the previous
+per-field Buffalo walk, over every command of the definition.
+
+    python benchmarks/codec.py
+"""
+import logging
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from zigpy_cc.buffalo import Buffalo, BuffaloOptions  # noqa: E402
+from zigpy_cc.codec import BufferAndListTypes, get_codec  # noqa: E402
+from zigpy_cc.definition import Definition  # noqa: E402
+from zigpy_cc.exception import TODO  # noqa: E402
+from zigpy_cc.types import ParameterType  # noqa: E402
+
+
+def read_parameters(data, parameters):
+    """ZpiObject.read_parameters as it was before the codecs"""
+    buffalo = Buffalo(data)
+    res = {}
+    length = None
+    start_index = None
+    for p in parameters:
+        options = BuffaloOptions()
+        name = p["name"]
+        param_type = p["parameterType"]
+        if param_type in BufferAndListTypes:
+            if isinstance(length, int):
+                options.length = length
+
+            if param_type == ParameterType.LIST_ASSOC_DEV:
+                if isinstance(start_index, int):
+                    options.startIndex = start_index
+
+        res[name] = buffalo.read_parameter(name, param_type, options)
+        start_index = length
+        length = res[name]
+
+    return res
+
+
+def write_parameters(payload, parameters):
+    """ZpiObject.to_unpi_frame's encoding as it was before the codecs"""
+    data = Buffalo(b"")
+    for p in parameters:
+        data.write_parameter(p["parameterType"], payload[p["name"]], {})
+    return data.buffer
+
+
+def samples():
+    """(parameters, data, payload) for every parameter list that round trips"""
+    rnd = random.Random(1)
+    result = []
+    for commands in Definition.values():
+        for cmd in commands:
+            for key in ("request", "response"):
+                parameters = cmd.get(key)
+                if not parameters:
+                    continue
+                # small values keep list and buffer lengths inside the data
+                data = bytes(rnd.randrange(3) for _ in range(64))
+                try:
+                    payload = read_parameters(data, parameters)
+                    encoded = write_parameters(payload, parameters)
+                except (OverflowError, TODO, TypeError):
+                    continue
+                result.append((parameters, encoded, payload))
+    return result
+
+
+def main():
+    # unsupported types log a warning for every sample that gets skipped
+    logging.getLogger("zigpy_cc.exception").setLevel(logging.ERROR)
+    cases = samples()
+    for parameters, data, payload in cases:
+        codec = get_codec(parameters)
+        assert codec.decode(data) == read_parameters(data, parameters)
+        assert codec.decode_lazy(data) == read_parameters(data, parameters)
+        assert codec.encode(payload) == write_parameters(payload, parameters)
+
+    def old_decode():
+        for parameters, data, _ in cases:
+            read_parameters(data, parameters)
+
+    def new_decode():
+        for parameters, data, _ in cases:
+            get_codec(parameters).decode(data)
+
+    def lazy_decode():
+        # dispatch usually reads a field or two of a received payload
+        for parameters, data, _ in cases:
+            payload = get_codec(parameters).decode_lazy(data)
+            payload.get(parameters[0]["name"])
+
+    def old_encode():
+        for parameters, _, payload in cases:
+            write_parameters(payload, parameters)
+
+    def new_encode():
+        for parameters, _, payload in cases:
+            get_codec(parameters).encode(payload)
+
+    print("{} parameter lists".format(len(cases)))
+    for label, func in (
+        ("decode buffalo", old_decode),
+        ("decode codec", new_decode),
+        ("decode lazy", lazy_decode),
+        ("encode buffalo", old_encode),
+        ("encode codec", new_encode),
+    ):
+        elapsed = min(timeit.repeat(func, number=50, repeat=3))
+        print("{:<15} {:>10.0f} payloads/s".format(label, len(cases) * 50 / elapsed))
+
+
+if __name__ == "__main__":
+    main()
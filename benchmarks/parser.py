@@ -0,0 +1,88 @@
+"""
+Compare frames/sec of the chunk parser against the previous per-byte parser.
+
+    python benchmarks/parser.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from zigpy_cc import uart  # noqa: E402
+
+FRAME = b"\xfe\x0ea\x02\x02\x00\x02\x06\x03\x90\x154\x01\x02\x01\x00\x00\x00\xdb"
+INCOMING_MSG = uart.UnpiFrame(2, 4, 0x81, bytes(range(60))).to_buffer()
+
+
+class BytewiseParser:
+    """The parser as it was before chunk parsing, one call per received byte"""
+
+    def __init__(self) -> None:
+        self.buffer = b""
+
+    def write(self, b: int):
+        self.buffer += bytes([b])
+        if uart.SOF == self.buffer[0]:
+            if len(self.buffer) > uart.MinMessageLength:
+                dataLength = self.buffer[uart.PositionDataLength]
+
+                fcsPosition = uart.DataStart + dataLength
+                frameLength = fcsPosition + 1
+
+                if len(self.buffer) >= frameLength:
+                    frameBuffer = self.buffer[0:frameLength]
+                    self.buffer = self.buffer[frameLength:]
+
+                    return uart.UnpiFrame.from_buffer(
+                        dataLength, fcsPosition, frameBuffer
+                    )
+        else:
+            self.buffer = b""
+
+        return None
+
+
+def run_bytewise(chunks):
+    parser = BytewiseParser()
+    count = 0
+    for chunk in chunks:
+        for b in chunk:
+            if parser.write(b) is not None:
+                count += 1
+    return count
+
+
+def run_chunked(chunks):
+    parser = uart.Parser()
+    count = 0
+    for chunk in chunks:
+        count += len(parser.write(chunk))
+    return count
+
+
+def make_chunks(frame, frames_per_read, reads):
+    data = frame * frames_per_read
+    # split in the middle of a frame, like a USB read boundary would
+    cut = len(data) // 2 + 3
+    return [data[:cut], data[cut:]] * reads
+
+
+def main():
+    for name, frame in (("version SRSP", FRAME), ("incomingMsg", INCOMING_MSG)):
+        for frames_per_read in (1, 16, 64):
+            chunks = make_chunks(frame, frames_per_read, 50)
+            total = frames_per_read * 50
+            assert run_bytewise(chunks) == run_chunked(chunks) == total
+
+            for label, func in (("bytewise", run_bytewise), ("chunked", run_chunked)):
+                elapsed = min(timeit.repeat(lambda: func(chunks), number=5, repeat=3))
+                print(
+                    "{:<13} {:>3} frames/read {:<9} {:>10.0f} frames/s".format(
+                        name, frames_per_read, label, total * 5 / elapsed
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
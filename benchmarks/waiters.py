@@ -0,0 +1,100 @@
+"""
+Per-frame waiter matching cost as the number of pending waiters grows.
+
+    python benchmarks/waiters.py
+"""
+import asyncio
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from zigpy_cc.api import Waiter, WaiterRegistry  # noqa: E402
+from zigpy_cc.types import CommandType, Subsystem  # noqa: E402
+from zigpy_cc.uart import UnpiFrame  # noqa: E402
+from zigpy_cc.zpi_object import ZpiObject  # noqa: E402
+
+FRAMES = [
+    # dataConfirm transid 200, no waiter for it
+    ZpiObject.from_unpi_frame(UnpiFrame(2, 4, 0x80, b"\x00\x01\xc8")),
+    # incomingMsg from 0x1234
+    ZpiObject.from_unpi_frame(
+        UnpiFrame(
+            2,
+            4,
+            0x81,
+            b"\x00\x00\x06\x00\x34\x12\x01\x01\x00\x80\x00\x00\x00\x00\x00\x00\x00",
+        )
+    ),
+]
+
+
+def make_waiters(count):
+    waiters = []
+    for i in range(count):
+        if i % 2:
+            waiter = Waiter(
+                i,
+                CommandType.AREQ,
+                Subsystem.AF,
+                "dataConfirm",
+                {"transid": i % 200},
+                10000,
+                None,
+            )
+        else:
+            waiter = Waiter(
+                i,
+                CommandType.AREQ,
+                Subsystem.ZDO,
+                "nodeDescRsp",
+                {"srcaddr": i},
+                10000,
+                None,
+            )
+        waiters.append(waiter)
+    return waiters
+
+
+def linear(waiters):
+    """The scan API.data_received did before the registry"""
+    table = {waiter.id: waiter for waiter in waiters}
+
+    def run():
+        for obj in FRAMES:
+            for waiter_id in list(table):
+                table.get(waiter_id).match(obj)
+
+    return run
+
+
+def indexed(waiters):
+    registry = WaiterRegistry()
+    for waiter in waiters:
+        registry[waiter.id] = waiter
+
+    def run():
+        for obj in FRAMES:
+            registry.match(obj)
+
+    return run
+
+
+def main():
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    for count in (0, 4, 16, 64, 256):
+        waiters = make_waiters(count)
+        for label, factory in (("linear", linear), ("indexed", indexed)):
+            run = factory(waiters)
+            number = 2000
+            elapsed = min(timeit.repeat(run, number=number, repeat=3))
+            print(
+                "{:>4} waiters {:<8} {:>7.2f} us/frame".format(
+                    count, label, elapsed / number / len(FRAMES) * 1e6
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import asyncio
 from asynctest import CoroutineMock, mock
 import pytest
 import serial
+from zigpy.types import EUI64
 
 from zigpy_cc import types as t, uart
 import zigpy_cc.api
@@ -11,6 +12,7 @@ from zigpy_cc.definition import Definition
 import zigpy_cc.exception
 import zigpy_cc.uart
 from zigpy_cc.uart import UnpiFrame
+from zigpy_cc.zigbee.common import NvItemsIds
 from zigpy_cc.zpi_object import ZpiObject
 
 DEVICE_CONFIG = zigpy_cc.config.SCHEMA_DEVICE(
@@ -272,3 +274,723 @@ async def test_probe_fail(mock_connect, mock_version, exception):
     assert mock_connect.call_args[0][0] == DEVICE_CONFIG
     assert mock_version.call_count == 1
     assert mock_connect.return_value.close.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_frames_received_batch(api):
+    app = mock.MagicMock()
+    api.set_application(app)
+    srsp = api.wait_for(t.CommandType.SRSP, t.Subsystem.ZDO, "nodeDescReq", {})
+    areq = api.wait_for(
+        t.CommandType.AREQ,
+        t.Subsystem.AF,
+        "dataConfirm",
+        {"transid": 7},
+        sequence=7,
+    )
+
+    api.frames_received(
+        [
+            UnpiFrame(3, 5, 2, b"\x00"),
+            UnpiFrame(2, 4, 0x80, b"\x00\x01\x07"),
+            UnpiFrame(2, 4, 0x80, b"\x00\x01\x08"),
+        ]
+    )
+
+    assert (await srsp.wait()).command == "nodeDescReq"
+    confirm = await areq.wait()
+    assert confirm.payload["transid"] == 7
+    assert confirm.sequence == 7
+    assert not api._waiters
+    assert [c[0][0].command for c in app.handle_znp.call_args_list] == [
+        "nodeDescReq",
+        "dataConfirm",
+        "dataConfirm",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_frames_received_in_order(api):
+    events = []
+    app = mock.MagicMock()
+    app.handle_znp.side_effect = lambda obj: events.append(
+        ("app", obj.command, srsp.future.done())
+    )
+    api.set_application(app)
+    api.add_handler(
+        t.Subsystem.AF,
+        "dataConfirm",
+        lambda obj: events.append(("handler", obj.command, srsp.future.done())),
+    )
+    srsp = api.wait_for(t.CommandType.SRSP, t.Subsystem.ZDO, "nodeDescReq", {})
+
+    # an indication received before the response to a later request
+    api.frames_received(
+        [UnpiFrame(2, 4, 0x80, b"\x00\x01\x07"), UnpiFrame(3, 5, 2, b"\x00")]
+    )
+
+    assert events == [
+        ("app", "dataConfirm", False),
+        ("handler", "dataConfirm", False),
+        ("app", "nodeDescReq", True),
+    ]
+    await srsp.wait()
+
+
+@pytest.mark.asyncio
+@mock.patch.object(zigpy_cc.api.API, "version", new_callable=CoroutineMock)
+@mock.patch.object(uart, "connect")
+async def test_detect_baudrate(mock_connect, mock_version):
+    """Test the fastest answering baudrate is picked."""
+
+    async def connect(config, api):
+        if config[zigpy_cc.config.CONF_DEVICE_BAUDRATE] > 230400:
+            raise serial.SerialException()
+        return mock.MagicMock()
+
+    mock_connect.side_effect = connect
+    baudrate = await zigpy_cc.api.API.detect_baudrate(DEVICE_CONFIG)
+    assert baudrate == 230400
+    assert [c[0][0]["baudrate"] for c in mock_connect.call_args_list] == [
+        921600,
+        460800,
+        230400,
+    ]
+
+    mock_connect.side_effect = serial.SerialException()
+    assert await zigpy_cc.api.API.detect_baudrate(DEVICE_CONFIG) is None
+
+
+@pytest.mark.asyncio
+@mock.patch.object(zigpy_cc.api.API, "detect_baudrate", new_callable=CoroutineMock)
+@mock.patch.object(uart, "connect")
+async def test_connect_auto_baudrate(mock_connect, mock_detect):
+    mock_detect.return_value = 460800
+    api = zigpy_cc.api.API(
+        {**DEVICE_CONFIG, zigpy_cc.config.CONF_DEVICE_BAUDRATE: "auto"}
+    )
+    await api.connect()
+    assert mock_connect.call_args[0][0][zigpy_cc.config.CONF_DEVICE_BAUDRATE] == 460800
+
+    mock_detect.return_value = None
+    api = zigpy_cc.api.API(
+        {**DEVICE_CONFIG, zigpy_cc.config.CONF_DEVICE_BAUDRATE: "auto"}
+    )
+    with pytest.raises(serial.SerialException):
+        await api.connect()
+
+
+def _ports(*paths):
+    ports = []
+    for path in paths:
+        port = mock.MagicMock()
+        port.device = path
+        ports.append(port)
+    return ports
+
+
+@pytest.mark.asyncio
+async def test_detect_port_parallel(monkeypatch):
+    monkeypatch.setattr(zigpy_cc.api, "_detected_ports", {})
+    monkeypatch.setattr(zigpy_cc.api, "AUTO_DETECT_TIMEOUT", 0.5)
+    ieee_a = EUI64.convert("00:12:4b:00:00:00:00:0a")
+    ieee_b = EUI64.convert("00:12:4b:00:00:00:00:0b")
+    answers = {"/dev/ttyACM0": None, "/dev/ttyACM1": ieee_a, "/dev/ttyUSB0": ieee_b}
+    probed = []
+
+    async def probe_coordinator(self, ieee):
+        path = self._config[zigpy_cc.config.CONF_DEVICE_PATH]
+        probed.append(path)
+        if answers[path] is None:
+            await asyncio.sleep(10)
+        return ieee is None or answers[path] == ieee
+
+    monkeypatch.setattr(zigpy_cc.api.API, "_probe_coordinator", probe_coordinator)
+    monkeypatch.setattr(uart, "list_ports", lambda: _ports(*sorted(answers)))
+
+    config = {**DEVICE_CONFIG, zigpy_cc.config.CONF_DEVICE_PATH: "auto"}
+    loop = asyncio.get_event_loop()
+    start = loop.time()
+    port = await zigpy_cc.api.API.detect_port(
+        {**config, zigpy_cc.config.CONF_DEVICE_IEEE: ieee_b}
+    )
+    assert port == "/dev/ttyUSB0"
+    assert loop.time() - start < 0.5
+    assert sorted(probed) == sorted(answers)
+
+    # the choice is cached and probed alone first
+    probed.clear()
+    port = await zigpy_cc.api.API.detect_port(
+        {**config, zigpy_cc.config.CONF_DEVICE_IEEE: ieee_b}
+    )
+    assert port == "/dev/ttyUSB0"
+    assert probed == ["/dev/ttyUSB0"]
+
+    # without an IEEE the first answering port wins
+    assert await zigpy_cc.api.API.detect_port(config) == "/dev/ttyACM1"
+
+    # nobody answers before the deadline
+    answers["/dev/ttyACM1"] = answers["/dev/ttyUSB0"] = None
+    zigpy_cc.api._detected_ports.clear()
+    with pytest.raises(serial.SerialException):
+        await zigpy_cc.api.API.detect_port(config)
+
+
+@pytest.mark.asyncio
+async def test_detect_port_and_baudrate(monkeypatch):
+    monkeypatch.setattr(zigpy_cc.api, "_detected_ports", {})
+    monkeypatch.setattr(zigpy_cc.api, "AUTO_DETECT_TIMEOUT", 0.3)
+    monkeypatch.setattr(zigpy_cc.api, "COMMAND_TIMEOUT", 0.2)
+    monkeypatch.setattr(zigpy_cc.api.API, "version", CoroutineMock())
+    monkeypatch.setattr(uart, "list_ports", lambda: _ports("/dev/null"))
+
+    async def connect(config, api):
+        # only the slowest of the candidates gets an answer
+        if config[zigpy_cc.config.CONF_DEVICE_BAUDRATE] != 115200:
+            await asyncio.sleep(10)
+        return mock.MagicMock()
+
+    monkeypatch.setattr(uart, "connect", connect)
+
+    config = {
+        **DEVICE_CONFIG,
+        zigpy_cc.config.CONF_DEVICE_PATH: "auto",
+        zigpy_cc.config.CONF_DEVICE_BAUDRATE: "auto",
+    }
+    # the baudrate scan takes longer than AUTO_DETECT_TIMEOUT on its own
+    assert await zigpy_cc.api.API.detect_port(config) == "/dev/null"
+
+
+@pytest.mark.asyncio
+async def test_waiter_registry_order(api):
+    confirm = (t.CommandType.AREQ, t.Subsystem.AF, "dataConfirm")
+    any_confirm = api.wait_for(*confirm)
+    tsn_5 = api.wait_for(*confirm, {"transid": 5}, sequence=5)
+    tsn_6 = api.wait_for(*confirm, {"transid": 6})
+    any_confirm2 = api.wait_for(*confirm, {"status": 0})
+    node_desc = api.wait_for(
+        t.CommandType.AREQ, t.Subsystem.ZDO, "nodeDescRsp", {"srcaddr": 0x1234}
+    )
+
+    obj = ZpiObject.from_unpi_frame(UnpiFrame(2, 4, 0x80, b"\x00\x01\x05"))
+    assert api._waiters.match(obj) == [any_confirm, tsn_5, any_confirm2]
+
+    api.frames_received([UnpiFrame(2, 4, 0x80, b"\x00\x01\x05")])
+    # tsn_5 has a sequence and stops the matching
+    assert any_confirm.future.done() and tsn_5.future.done()
+    assert not any_confirm2.future.done()
+    assert sorted(api._waiters) == [tsn_6.id, any_confirm2.id, node_desc.id]
+
+    api.frames_received([UnpiFrame(2, 4, 0x80, b"\x00\x01\x06")])
+    assert tsn_6.future.done() and any_confirm2.future.done()
+    assert list(api._waiters) == [node_desc.id]
+    assert len(api._waiters._index) == 1
+
+    api._waiters.pop(node_desc.id)
+    assert not api._waiters._index
+    assert api._waiters.pop(node_desc.id, None) is None
+
+
+@pytest.mark.asyncio
+async def test_waiter_timeout(api):
+    waiter = api.wait_for(
+        t.CommandType.AREQ, t.Subsystem.AF, "dataConfirm", {"transid": 1}, timeout=20
+    )
+    with pytest.raises(asyncio.TimeoutError):
+        await waiter.wait()
+    assert waiter.expired
+    assert waiter.id not in api._waiters
+    assert api._waiters._timer is None
+
+
+@pytest.mark.asyncio
+async def test_waiter_single_timer(api):
+    confirm = (t.CommandType.AREQ, t.Subsystem.AF, "dataConfirm")
+    late = api.wait_for(*confirm, {"transid": 1}, timeout=10000)
+    timer = api._waiters._timer
+    # a later deadline keeps the armed timer, an earlier one re-arms it
+    api.wait_for(*confirm, {"transid": 2}, timeout=20000)
+    assert api._waiters._timer is timer
+    early = api.wait_for(*confirm, {"transid": 3}, timeout=20)
+    assert api._waiters._timer is not timer
+    assert timer.cancelled()
+
+    with pytest.raises(asyncio.TimeoutError):
+        await early.wait()
+    assert not late.future.done()
+    assert api._waiters._timer.when() == late.deadline
+
+
+@pytest.mark.asyncio
+async def test_waiter_deadlines_compact(api):
+    confirm = (t.CommandType.AREQ, t.Subsystem.AF, "dataConfirm")
+    keep = api.wait_for(*confirm, {"transid": 0}, timeout=10000)
+    for i in range(1000):
+        api.frames_received([UnpiFrame(2, 4, 0x80, b"\x00\x01\x01")])
+        waiter = api.wait_for(*confirm, {"transid": 1}, timeout=10000)
+    api.frames_received([UnpiFrame(2, 4, 0x80, b"\x00\x01\x01")])
+
+    assert waiter.future.done()
+    assert list(api._waiters) == [keep.id]
+    assert len(api._waiters._deadlines) <= 2 + api._waiters.COMPACT_SLACK
+
+
+PING_RSP = UnpiFrame(3, 1, 1, b"\x79\x01")
+NV_WRITE_RSP = UnpiFrame(3, 1, 9, b"\x00")
+VERSION_RSP = UnpiFrame(
+    3, 1, 2, b"\x02\x00\x02\x06\x03\x90\x154\x01\x02\x01\x00\x00\x00"
+)
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_request_waits_for_send_queue(api):
+    gw = uart.Gateway(api)
+    gw._transport = mock.MagicMock()
+    gw._open = True
+    api._uart = gw
+    gw.pause_writing()
+    gw.write(bytes(uart.SEND_HIGH_WATER + 1))
+
+    task = asyncio.ensure_future(api.request(t.Subsystem.SYS, "ping", {}))
+    await settle()
+    assert len(gw._tx_buffer) == uart.SEND_HIGH_WATER + 1
+
+    gw.resume_writing()
+    await settle()
+    ping = UnpiFrame(1, 1, 1, b"").to_buffer()
+    assert gw._transport.write.call_args[0][0] == ping
+    api.frames_received([PING_RSP])
+    await task
+
+
+@pytest.mark.asyncio
+async def test_request_serialized_by_default(api):
+    ping = asyncio.ensure_future(api.request(t.Subsystem.SYS, "ping", {}))
+    version = asyncio.ensure_future(api.request(t.Subsystem.SYS, "version", {}))
+    await settle()
+    assert api._uart.send.call_count == 1
+
+    api.frames_received([PING_RSP])
+    await ping
+    await settle()
+    assert api._uart.send.call_count == 2
+    api.frames_received([VERSION_RSP])
+    assert (await version).command == "version"
+
+
+@pytest.mark.asyncio
+async def test_request_pipelined():
+    api = zigpy_cc.api.API({**DEVICE_CONFIG, zigpy_cc.config.CONF_SREQ_IN_FLIGHT: 2})
+    api._uart = mock.MagicMock()
+
+    write1 = asyncio.ensure_future(api.request(*nv_write(1)))
+    write2 = asyncio.ensure_future(api.request(*nv_write(2)))
+    version = asyncio.ensure_future(api.request(t.Subsystem.SYS, "version", {}))
+    info = asyncio.ensure_future(api.request(t.Subsystem.UTIL, "getDeviceInfo", {}))
+    await settle()
+    # write2 queues behind write1, getDeviceInfo waits for a free slot
+    sent = [call[0][0].command_id for call in api._uart.send.call_args_list]
+    assert sent == [9, 2]
+
+    api.frames_received([VERSION_RSP])
+    assert (await version).command == "version"
+    await settle()
+    assert api._uart.send.call_count == 3
+    assert api._uart.send.call_args[0][0].subsystem == t.Subsystem.UTIL
+
+    api.frames_received([NV_WRITE_RSP])
+    await write1
+    await settle()
+    assert not write2.done()
+    assert api._uart.send.call_count == 4
+    api.frames_received([NV_WRITE_RSP])
+    await write2
+    info.cancel()
+
+
+def test_builtin_handlers(api):
+    assert api._handlers[(t.Subsystem.SYS, "version")] == [api._handle_version]
+    assert (t.Subsystem.UTIL, "getDeviceInfo") in api._handlers
+    assert (t.Subsystem.SYS, "ping") not in api._handlers
+
+
+def test_add_remove_handler(api):
+    handler = mock.MagicMock()
+    api.add_handler(t.Subsystem.SYS, "ping", handler)
+    api.frames_received([PING_RSP, VERSION_RSP])
+    assert handler.call_count == 1
+    assert handler.call_args[0][0].payload == {"capabilities": 0x0179}
+
+    api.remove_handler(t.Subsystem.SYS, "ping", handler)
+    assert (t.Subsystem.SYS, "ping") not in api._handlers
+    api.frames_received([PING_RSP])
+    assert handler.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_connection_lost_aborts_requests(api):
+    api.set_application(mock.MagicMock())
+    ping = asyncio.ensure_future(api.request(t.Subsystem.SYS, "ping", {}))
+    version = asyncio.ensure_future(api.request(t.Subsystem.SYS, "version", {}))
+    response = api.wait_for(t.CommandType.AREQ, t.Subsystem.ZDO, "nodeDescRsp")
+    await settle()
+    assert api._uart.send.call_count == 1
+
+    api.connection_lost()
+    assert api._app.connection_lost.call_count == 1
+    assert not api._waiters
+    with pytest.raises(zigpy_cc.exception.RequestAborted):
+        await ping
+    # version was still queued and is never sent
+    with pytest.raises(zigpy_cc.exception.RequestAborted):
+        await version
+    with pytest.raises(zigpy_cc.exception.RequestAborted):
+        await response.wait()
+    assert api._uart.send.call_count == 1
+
+    # requests made afterwards go through
+    ping = asyncio.ensure_future(api.request(t.Subsystem.SYS, "ping", {}))
+    await settle()
+    api.frames_received([PING_RSP])
+    assert (await ping).command == "ping"
+
+
+@pytest.mark.asyncio
+async def test_close_while_draining(api):
+    drained = asyncio.get_event_loop().create_future()
+    api._uart.writable = False
+    api._uart.drain = CoroutineMock(side_effect=lambda: drained)
+    ping = asyncio.ensure_future(api.request(t.Subsystem.SYS, "ping", {}))
+    version = asyncio.ensure_future(api.request(t.Subsystem.SYS, "version", {}))
+    await settle()
+    uart = api._uart
+
+    api.close()
+    drained.set_result(None)
+    for request in (ping, version):
+        with pytest.raises(zigpy_cc.exception.RequestAborted):
+            await request
+    assert uart.send.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_reset_aborts_waiters(api):
+    response = api.wait_for(t.CommandType.AREQ, t.Subsystem.ZDO, "nodeDescRsp")
+    reset = asyncio.ensure_future(api.request(t.Subsystem.SYS, "resetReq", {"type": 1}))
+    await settle()
+    with pytest.raises(zigpy_cc.exception.RequestAborted):
+        await response.wait()
+    assert [w.matcher.command for w in api._waiters.values()] == ["resetInd"]
+    reset.cancel()
+
+
+@pytest.mark.asyncio
+async def test_request_learns_timeout(api):
+    for _ in range(3):
+        ping = asyncio.ensure_future(api.request(t.Subsystem.SYS, "ping", {}))
+        await settle()
+        api.frames_received([PING_RSP])
+        await ping
+
+    stats = api.latency_stats[(t.Subsystem.SYS, "ping")]
+    assert stats.samples == 3
+    assert stats.rto == zigpy_cc.config.CONF_SREQ_TIMEOUT_MIN_DEFAULT
+
+    ping = asyncio.ensure_future(api.request(t.Subsystem.SYS, "ping", {}))
+    await settle()
+    waiter = next(iter(api._waiters.values()))
+    assert waiter.timeout == zigpy_cc.config.CONF_SREQ_TIMEOUT_MIN_DEFAULT
+    ping.cancel()
+
+
+async def learn_nv_write_timeout():
+    api = zigpy_cc.api.API({**DEVICE_CONFIG, zigpy_cc.config.CONF_SREQ_TIMEOUT_MIN: 50})
+    api._uart = mock.MagicMock()
+    for _ in range(3):
+        request = asyncio.ensure_future(api.request(*nv_write(1)))
+        await settle()
+        api.frames_received([NV_WRITE_RSP])
+        await request
+    return api
+
+
+@pytest.mark.asyncio
+async def test_late_response_not_taken_by_next_request():
+    api = await learn_nv_write_timeout()
+
+    # the learned 50 ms run out, the adapter answers after that
+    with pytest.raises(asyncio.TimeoutError):
+        await api.request(*nv_write(2))
+    request = asyncio.ensure_future(api.request(*nv_write(3)))
+    await settle()
+    # held back until the response to the second write arrived
+    assert api._uart.send.call_count == 4
+    api.frames_received([UnpiFrame(3, 1, 9, b"\x0a")])
+    await settle()
+    assert api._uart.send.call_count == 5
+    assert not request.done()
+
+    api.frames_received([NV_WRITE_RSP])
+    assert (await request).payload["status"] == 0
+
+
+@pytest.mark.asyncio
+async def test_lost_response_holds_next_request(monkeypatch):
+    monkeypatch.setitem(
+        zigpy_cc.api.SREQ_TIMEOUTS, (t.Subsystem.SYS, "osalNvWrite"), 300
+    )
+    api = await learn_nv_write_timeout()
+
+    # the response is lost, the caller still gives up after the learned timeout
+    loop = asyncio.get_event_loop()
+    start = loop.time()
+    with pytest.raises(asyncio.TimeoutError):
+        await api.request(*nv_write(2))
+    assert loop.time() - start < 0.2
+    request = asyncio.ensure_future(api.request(*nv_write(3)))
+    await settle()
+    assert api._uart.send.call_count == 4
+
+    # the next write goes out once the static timeout ran out
+    await asyncio.sleep(0.3)
+    assert api._uart.send.call_count == 5
+    api.frames_received([NV_WRITE_RSP])
+    assert (await request).payload["status"] == 0
+
+
+def nv_write(item_id):
+    return (
+        t.Subsystem.SYS,
+        "osalNvWrite",
+        {"id": item_id, "offset": 0, "len": 1, "value": b"\x01"},
+    )
+
+
+def data_request(transid, cluster):
+    return (
+        t.Subsystem.AF,
+        "dataRequest",
+        {
+            "dstaddr": 0x1234,
+            "destendpoint": 1,
+            "srcendpoint": 1,
+            "clusterid": cluster,
+            "transid": transid,
+            "options": 0,
+            "radius": 30,
+            "len": 3,
+            "data": b"\x01\x02\x01",
+        },
+    )
+
+
+@pytest.mark.asyncio
+async def test_data_requests_by_priority(api):
+    requests = [
+        asyncio.ensure_future(api.request(*data_request(1, 0x0006))),
+        # an OTA block queued before an on/off command is sent after it
+        asyncio.ensure_future(api.request(*data_request(2, 0x0019))),
+        asyncio.ensure_future(api.request(*data_request(3, 0x0006))),
+    ]
+    await settle()
+    for _ in requests:
+        api.frames_received([UnpiFrame(3, 4, 1, b"\x00")])
+        await settle()
+
+    sent = [
+        ZpiObject.from_unpi_frame(call[0][0]).payload["transid"]
+        for call in api._uart.send.call_args_list
+    ]
+    assert sent == [1, 3, 2]
+    for request in requests:
+        await request
+
+
+@pytest.mark.asyncio
+async def test_request_many():
+    api = zigpy_cc.api.API({**DEVICE_CONFIG, zigpy_cc.config.CONF_SREQ_IN_FLIGHT: 2})
+    api._uart = mock.MagicMock()
+    batch = asyncio.ensure_future(
+        api.request_many(
+            [(t.Subsystem.SYS, "ping", {}), (t.Subsystem.SYS, "version", {}, [0])]
+        )
+    )
+    await settle()
+    # both sent before any response
+    assert api._uart.send.call_count == 2
+    api.frames_received([VERSION_RSP, PING_RSP])
+    ping, version = await batch
+    assert (ping.command, version.command) == ("ping", "version")
+
+
+@pytest.mark.asyncio
+async def test_request_many_stops_on_failure(api):
+    batch = asyncio.ensure_future(
+        api.request_many([nv_write(1), nv_write(2), nv_write(3)])
+    )
+    await settle()
+    api.frames_received([UnpiFrame(3, 1, 9, b"\x0a")])
+    with pytest.raises(zigpy_cc.exception.CommandError):
+        await batch
+    # the second write went out already, the third is never sent
+    assert api._uart.send.call_count == 2
+
+    # the response to the cancelled second write doesn't answer the next one
+    request = asyncio.ensure_future(api.request(*nv_write(4)))
+    await settle()
+    assert api._uart.send.call_count == 2
+    api.frames_received([UnpiFrame(3, 1, 9, b"\x0a")])
+    await settle()
+    assert api._uart.send.call_count == 3
+    assert not request.done()
+    api.frames_received([NV_WRITE_RSP])
+    assert (await request).payload["status"] == 0
+
+
+@pytest.mark.asyncio
+async def test_request_many_return_exceptions(api):
+    batch = asyncio.ensure_future(
+        api.request_many([nv_write(1), nv_write(2)], return_exceptions=True)
+    )
+    await settle()
+    api.frames_received([UnpiFrame(3, 1, 9, b"\x0a")])
+    await settle()
+    api.frames_received([UnpiFrame(3, 1, 9, b"\x00")])
+    failed, written = await batch
+    assert isinstance(failed, zigpy_cc.exception.CommandError)
+    assert written.payload["status"] == 0
+
+
+@pytest.mark.asyncio
+async def test_request_shared(api):
+    ping1 = asyncio.ensure_future(api.request(t.Subsystem.SYS, "ping", {}))
+    ping2 = asyncio.ensure_future(api.request(t.Subsystem.SYS, "ping", {}))
+    write1 = asyncio.ensure_future(api.request(*nv_write(1)))
+    write2 = asyncio.ensure_future(api.request(*nv_write(1)))
+    await settle()
+    api.frames_received([PING_RSP])
+    ping1, ping2 = await ping1, await ping2
+    assert ping1 is not ping2
+    assert ping1.payload == ping2.payload
+    await settle()
+    api.frames_received([NV_WRITE_RSP])
+    await write1
+    await settle()
+    api.frames_received([NV_WRITE_RSP])
+    await write2
+
+    # one ping, two writes
+    assert api._uart.send.call_count == 3
+    assert not api._shared_requests
+
+
+@pytest.mark.asyncio
+async def test_request_zdo_not_shared(api):
+    payload = {"dstaddr": 0x1234, "nwkaddrofinterest": 0x1234}
+    requests = [
+        asyncio.ensure_future(api.request(t.Subsystem.ZDO, "nodeDescReq", payload))
+        for _ in range(2)
+    ]
+    for request in requests:
+        await settle()
+        api.frames_received([UnpiFrame(3, 5, 2, b"\x00")])
+        await request
+
+    assert api._uart.send.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_request_shared_cancel(api):
+    ping1 = asyncio.ensure_future(api.request(t.Subsystem.SYS, "ping", {}))
+    ping2 = asyncio.ensure_future(api.request(t.Subsystem.SYS, "ping", {}))
+    ping3 = asyncio.ensure_future(api.request(t.Subsystem.SYS, "ping", {}))
+    await settle()
+    # a follower giving up leaves the request alone
+    ping3.cancel()
+    await settle()
+    assert not ping1.done() and not ping2.done()
+
+    # the sending caller giving up hands the request to the next one
+    ping1.cancel()
+    await settle()
+    assert not ping2.done()
+    api.frames_received([PING_RSP])
+    await settle()
+    api.frames_received([PING_RSP])
+    assert (await ping2).command == "ping"
+
+
+async def request_version(api):
+    version = asyncio.ensure_future(api.request(t.Subsystem.SYS, "version", {}))
+    await settle()
+    if not version.done():
+        api.frames_received([VERSION_RSP])
+    return await version
+
+
+@pytest.mark.asyncio
+async def test_response_cache(api):
+    first = await request_version(api)
+    first.payload = {}
+    first.sequence = 1
+    second = await request_version(api)
+    # callers changing their response don't change what the others get
+    assert second.payload == ZpiObject.from_unpi_frame(VERSION_RSP).payload
+    assert second.sequence is None
+    assert api._uart.send.call_count == 1
+    assert (api.cache_stats.hits, api.cache_stats.misses) == (1, 1)
+
+    # a reset indication invalidates the cache
+    api.frames_received([UnpiFrame(2, 1, 0x80, b"\x00\x02\x00\x02\x06\x03")])
+    assert api.cache_stats.invalidations == 1
+    await request_version(api)
+    assert api._uart.send.call_count == 2
+
+    # so does writing to the NV memory
+    write = asyncio.ensure_future(api.request(*nv_write(1)))
+    await settle()
+    api.frames_received([NV_WRITE_RSP])
+    await write
+    await request_version(api)
+    assert api._uart.send.call_count == 4
+    assert (api.cache_stats.hits, api.cache_stats.misses) == (1, 3)
+
+
+@pytest.mark.asyncio
+async def test_response_cache_static_nv_items(api):
+    def nv_read(item_id):
+        return asyncio.ensure_future(
+            api.request(t.Subsystem.SYS, "osalNvRead", {"id": item_id, "offset": 0})
+        )
+
+    for item_id in (NvItemsIds.PANID, NvItemsIds.PANID, NvItemsIds.NIB):
+        read = nv_read(item_id)
+        await settle()
+        if not read.done():
+            api.frames_received([UnpiFrame(3, 1, 8, b"\x00\x02\x34\x12")])
+        assert (await read).payload["value"] == b"\x34\x12"
+    # the NIB changes without writes from the host and is read again
+    read = nv_read(NvItemsIds.NIB)
+    await settle()
+    assert not read.done()
+    read.cancel()
+    assert api._uart.send.call_count == 3
+
+    # neither are device info answers cached
+    assert (t.Subsystem.UTIL, "getDeviceInfo") not in zigpy_cc.api.RESPONSE_CACHE_TTLS
+
+
+@pytest.mark.asyncio
+async def test_response_cache_expires(api):
+    with mock.patch.dict(
+        zigpy_cc.api.RESPONSE_CACHE_TTLS, {(t.Subsystem.SYS, "version"): 0}
+    ):
+        await request_version(api)
+        await request_version(api)
+    assert api._uart.send.call_count == 2
+    assert api.cache_stats.hits == 0
@@ -0,0 +1,99 @@
+import io
+import struct
+
+from asynctest import mock
+import pytest
+
+from zigpy_cc import capture, uart
+
+
+@pytest.fixture
+def ring_path(tmp_path):
+    return str(tmp_path / "capture.bin")
+
+
+def test_ring_wraps_oldest_first(ring_path):
+    ring = capture.RingCapture(ring_path, capture.HEADER.size + 4 * capture.SLOT_SIZE)
+    for i in range(6):
+        ring.write(capture.TX if i % 2 else capture.RX, bytes([0xFE, i]))
+    ring.close()
+
+    records = list(capture.read_capture(ring_path))
+    assert [r.sequence for r in records] == [2, 3, 4, 5]
+    assert [r.data for r in records] == [bytes([0xFE, i]) for i in range(2, 6)]
+    assert [r.direction for r in records] == [0, 1, 0, 1]
+
+
+def test_ring_reopen_continues(ring_path):
+    ring = capture.RingCapture(ring_path, 64 * 1024)
+    ring.write(capture.TX, b"\xfe\x00\x21\x01\x20")
+    ring.close()
+
+    ring = capture.RingCapture(ring_path, 64 * 1024)
+    ring.write(capture.RX, b"\xfe\x02\x61\x01\x79\x07\x1c")
+    ring.close()
+
+    records = list(capture.read_capture(ring_path))
+    assert [r.sequence for r in records] == [0, 1]
+
+
+def test_ring_long_data_spans_slots(ring_path):
+    ring = capture.RingCapture(ring_path, 64 * 1024)
+    data = bytes(range(256)) * 3
+    ring.write(capture.RX, data)
+    ring.close()
+
+    records = list(capture.read_capture(ring_path))
+    assert [r.sequence for r in records] == [0, 1, 2]
+    assert b"".join(r.data for r in records) == data
+
+
+def test_ring_refuses_other_files(ring_path):
+    with open(ring_path, "wb") as f:
+        f.write(b"precious data" * 100)
+
+    with pytest.raises(ValueError):
+        capture.RingCapture(ring_path, 64 * 1024)
+    with open(ring_path, "rb") as f:
+        assert f.read() == b"precious data" * 100
+
+
+def test_dump(ring_path):
+    ring = capture.RingCapture(ring_path, 64 * 1024)
+    ring.write(capture.TX, b"\xfe\x00\x21\x01\x20")
+    ring.close()
+
+    out = io.StringIO()
+    capture.dump_text(capture.read_capture(ring_path), out)
+    assert out.getvalue().endswith("0 TX fe 00 21 01 20\n")
+
+    out = io.BytesIO()
+    capture.dump_pcap(capture.read_capture(ring_path), out)
+    data = out.getvalue()
+    assert capture.PCAP_HEADER.unpack_from(data)[-1] == capture.LINKTYPE_USER0
+    assert data.endswith(b"\x01\xfe\x00\x21\x01\x20")
+    _, _, length, _ = struct.unpack_from("<IIII", data, capture.PCAP_HEADER.size)
+    assert length == 6
+
+
+@pytest.mark.asyncio
+async def test_gateway_capture(ring_path):
+    gw = uart.Gateway(mock.MagicMock())
+    gw._transport = mock.MagicMock()
+    gw.start_capture(ring_path, 64 * 1024)
+
+    ping = uart.UnpiFrame(1, 1, 1, b"")
+    gw.write(b"\xef")
+    gw.send(ping)
+    gw.data_received(b"\x00\xfe\x02\x61\x01\x79\x07\x1c")
+    # garbage and a frame failing its checksum
+    gw.data_received(b"\x13\x37\xfe\x02\x61\x01\x79\x07\x1d")
+    gw.close()
+
+    records = list(capture.read_capture(ring_path))
+    assert [(r.direction, r.data) for r in records] == [
+        (capture.TX, b"\xef"),
+        (capture.TX, ping.to_buffer()),
+        (capture.RX, b"\x00\xfe\x02\x61\x01\x79\x07\x1c"),
+        (capture.RX, b"\x13\x37\xfe\x02\x61\x01\x79\x07\x1d"),
+    ]
@@ -0,0 +1,143 @@
+import random
+
+import pytest
+
+from zigpy_cc.buffalo import Buffalo
+from zigpy_cc.codec import Codec, LazyPayload, get_codec
+from zigpy_cc.definition import Definition
+from zigpy_cc.exception import TODO
+from zigpy_cc.types import AddressMode, ParameterType, Subsystem
+
+PARAMETER_LISTS = [
+    cmd[key]
+    for commands in Definition.values()
+    for cmd in commands
+    for key in ("request", "response")
+    if key in cmd
+]
+
+
+def outcome(func, *args):
+    try:
+        return func(*args)
+    except (OverflowError, TODO, TypeError, ValueError, KeyError) as exc:
+        return type(exc)
+
+
+def test_decode_matches_buffalo():
+    rnd = random.Random(4)
+    for parameters in PARAMETER_LISTS:
+        codec = get_codec(parameters)
+        for size in (0, 3, 20, 120):
+            data = bytes(rnd.randrange(4) for _ in range(size))
+            expected = outcome(codec._read, Buffalo(data), 0, {}, None, None)
+            assert outcome(codec.decode, data) == expected, parameters
+
+
+def test_encode_matches_buffalo():
+    rnd = random.Random(4)
+    for parameters in PARAMETER_LISTS:
+        codec = get_codec(parameters)
+        payload = {}
+        for p in parameters:
+            param_type = p["parameterType"]
+            if param_type == ParameterType.UINT8:
+                payload[p["name"]] = rnd.randrange(0x100)
+            elif param_type == ParameterType.UINT16:
+                payload[p["name"]] = rnd.randrange(0x10000)
+            elif param_type == ParameterType.UINT32:
+                payload[p["name"]] = rnd.randrange(0x100000000)
+            elif param_type == ParameterType.IEEEADDR:
+                payload[p["name"]] = list(range(8))
+            elif param_type == ParameterType.BUFFER:
+                payload[p["name"]] = b"\x01\x02"
+            else:
+                payload[p["name"]] = [1, 2]
+        expected = outcome(codec._write, Buffalo(b""), 0, payload)
+        assert outcome(codec.encode, payload) == expected, parameters
+
+
+def test_decode_conversions():
+    cmd = next(c for c in Definition[Subsystem.AF] if c["name"] == "incomingMsg")
+    data = bytes(16) + b"\x02\xaa\xbb"
+    payload = get_codec(cmd["request"]).decode(data)
+    assert payload["len"] == 2
+    assert payload["data"] == b"\xaa\xbb"
+    assert type(payload["srcaddr"]).__name__ == "NWK"
+
+
+@pytest.mark.parametrize("value", [0x100, -1])
+def test_encode_out_of_range(value):
+    codec = Codec([{"name": "a", "parameterType": ParameterType.UINT8}])
+    with pytest.raises(OverflowError):
+        codec.encode({"a": value})
+
+
+def test_decode_short():
+    codec = Codec(
+        [
+            {"name": "a", "parameterType": ParameterType.UINT16},
+            {"name": "b", "parameterType": ParameterType.UINT8},
+        ]
+    )
+    assert codec.decode(b"\x01\x02\x03") == {"a": 0x0201, "b": 3}
+    with pytest.raises(OverflowError):
+        codec.decode(b"\x01\x02")
+
+
+def test_decode_lazy_matches_decode():
+    rnd = random.Random(4)
+    for parameters in PARAMETER_LISTS:
+        codec = get_codec(parameters)
+        for size in (0, 3, 20, 120):
+            data = bytes(rnd.randrange(4) for _ in range(size))
+            expected = outcome(codec.decode, data)
+            payload = outcome(codec.decode_lazy, data)
+            if isinstance(expected, dict):
+                assert dict(payload) == expected, parameters
+                assert repr(payload) == repr(expected)
+            else:
+                assert payload == expected, parameters
+
+
+def test_decode_lazy_on_access():
+    cmd = next(c for c in Definition[Subsystem.AF] if c["name"] == "incomingMsg")
+    data = bytes(4) + b"\x34\x12" + bytes(10) + b"\x02\xaa\xbb"
+    payload = get_codec(cmd["request"]).decode_lazy(data)
+    assert isinstance(payload, LazyPayload)
+    # the data following the prefix is decoded up front
+    assert payload._values == {"data": b"\xaa\xbb"}
+
+    assert "srcaddr" in payload
+    assert "foo" not in payload
+    assert payload._values == {"data": b"\xaa\xbb"}
+
+    assert payload["srcaddr"] == 0x1234
+    assert type(payload["srcaddr"]).__name__ == "NWK"
+    assert set(payload._values) == {"data", "srcaddr"}
+    assert payload.get("foo") is None
+    with pytest.raises(KeyError):
+        payload["foo"]
+    assert len(payload) == len(cmd["request"])
+    assert payload == get_codec(cmd["request"]).decode(data)
+
+
+def test_decode_lazy_bad_enum():
+    codec = Codec(
+        [
+            {"name": "dstaddrmode", "parameterType": ParameterType.UINT8},
+            {"name": "dstaddr", "parameterType": ParameterType.UINT16},
+        ]
+    )
+    # not an AddressMode, fails while decoding and not on access
+    with pytest.raises(ValueError):
+        codec.decode_lazy(b"\x09\x34\x12")
+    payload = codec.decode_lazy(b"\x02\x34\x12")
+    assert payload._values == {"dstaddrmode": AddressMode.ADDR_16BIT}
+    assert payload == {"dstaddrmode": AddressMode.ADDR_16BIT, "dstaddr": 0x1234}
+
+
+def test_decode_lazy_short():
+    codec = Codec([{"name": "a", "parameterType": ParameterType.UINT16}])
+    with pytest.raises(OverflowError):
+        codec.decode_lazy(b"\x01")
@@ -0,0 +1,43 @@
+import pytest
+import voluptuous as vol
+
+import zigpy_cc.config as config
+
+
+def device_config(**kwargs):
+    return config.CONFIG_SCHEMA(
+        {config.CONF_DEVICE: {config.CONF_DEVICE_PATH: "/dev/null", **kwargs}}
+    )[config.CONF_DEVICE]
+
+
+def test_sreq_timeouts_default():
+    device = device_config()
+    assert device[config.CONF_SREQ_TIMEOUT_MIN] == config.CONF_SREQ_TIMEOUT_MIN_DEFAULT
+    assert device[config.CONF_SREQ_TIMEOUT_MAX] is None
+
+
+def test_sreq_timeouts():
+    device = device_config(sreq_timeout_min="100", sreq_timeout_max=3000)
+    assert device[config.CONF_SREQ_TIMEOUT_MIN] == 100
+    assert device[config.CONF_SREQ_TIMEOUT_MAX] == 3000
+
+
+@pytest.mark.parametrize(
+    "key, value",
+    [
+        ("sreq_timeout_min", 0),
+        ("sreq_timeout_min", "fast"),
+        ("sreq_timeout_max", -1),
+        ("sreq_timeout_max", 10**6),
+    ],
+)
+def test_sreq_timeouts_invalid(key, value):
+    with pytest.raises(vol.Invalid):
+        device_config(**{key: value})
+
+
+def test_data_credits():
+    assert device_config()[config.CONF_DATA_CREDITS] is None
+    assert device_config(data_credits="4")[config.CONF_DATA_CREDITS] == 4
+    with pytest.raises(vol.Invalid):
+        device_config(data_credits=0)
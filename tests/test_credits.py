@@ -0,0 +1,198 @@
+import asyncio
+
+from asynctest import mock
+import pytest
+
+from zigpy_cc import types as t
+import zigpy_cc.api
+import zigpy_cc.config
+import zigpy_cc.exception
+from zigpy_cc.credits import DataCredits
+from zigpy_cc.uart import UnpiFrame
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def take(credits, order, name, transid=0):
+    async def run():
+        await credits.acquire(transid)
+        order.append(name)
+
+    return asyncio.ensure_future(run())
+
+
+@pytest.mark.asyncio
+async def test_unlimited():
+    credits = DataCredits()
+    for transid in range(100):
+        await credits.acquire(transid)
+        credits.sent(transid)
+    assert credits.outstanding == 100
+    assert credits.stats.waits == 0
+
+
+@pytest.mark.asyncio
+async def test_wait_for_confirm():
+    credits = DataCredits(2)
+    order = []
+    for transid in (1, 2):
+        await credits.acquire(transid)
+        credits.sent(transid)
+
+    tasks = [take(credits, order, "a", 4), take(credits, order, "b", 5)]
+    await settle()
+    assert order == []
+
+    credits.confirmed(3)  # unknown transid
+    await settle()
+    assert order == []
+
+    credits.confirmed(1)
+    await settle()
+    assert order == ["a"]
+    credits.sent(4)
+
+    credits.confirmed(2)
+    await settle()
+    assert order == ["a", "b"]
+    await asyncio.gather(*tasks)
+    assert credits.stats.waits == 2
+    assert credits.stats.confirmed == 2
+    assert credits.stats.max_outstanding == 2
+
+
+@pytest.mark.asyncio
+async def test_cancel_reservation():
+    credits = DataCredits(1)
+    order = []
+    await credits.acquire(1)
+    task = take(credits, order, "a", 2)
+    await settle()
+    credits.cancel(1)
+    await settle()
+    assert order == ["a"]
+    await task
+
+    # a sent request failing gives its credit back as well
+    credits.sent(2)
+    task = take(credits, order, "b", 3)
+    await settle()
+    credits.cancel(2)
+    await settle()
+    assert order == ["a", "b"]
+    assert credits.outstanding == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_credit():
+    credits = DataCredits(1, timeout=0.05)
+    await credits.acquire(1)
+    credits.sent(1)
+
+    await asyncio.wait_for(credits.acquire(2), 1)
+    assert credits.stats.expired == 1
+    assert credits.outstanding == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_passes_turn():
+    credits = DataCredits(1)
+    order = []
+    await credits.acquire(1)
+    credits.sent(1)
+    first = take(credits, order, "first")
+    second = take(credits, order, "second")
+    await settle()
+    first.cancel()
+    await settle()
+    credits.confirmed(1)
+    await settle()
+    assert order == ["second"]
+    await second
+
+
+@pytest.fixture
+def api():
+    api = zigpy_cc.api.API(
+        zigpy_cc.config.SCHEMA_DEVICE(
+            {
+                zigpy_cc.config.CONF_DEVICE_PATH: "/dev/null",
+                zigpy_cc.config.CONF_DATA_CREDITS: 1,
+            }
+        )
+    )
+    api._uart = mock.MagicMock()
+    return api
+
+
+def data_request(api, transid):
+    return api.request(
+        t.Subsystem.AF,
+        "dataRequest",
+        {
+            "dstaddr": 0x1234,
+            "destendpoint": 1,
+            "srcendpoint": 1,
+            "clusterid": 6,
+            "transid": transid,
+            "options": 0,
+            "radius": 30,
+            "len": 3,
+            "data": b"\x01\x02\x01",
+        },
+    )
+
+
+@pytest.mark.asyncio
+async def test_api_data_request_credits(api):
+    first = asyncio.ensure_future(data_request(api, 1))
+    second = asyncio.ensure_future(data_request(api, 2))
+    await settle()
+    api.frames_received([UnpiFrame(3, 4, 1, b"\x00")])
+    await first
+    await settle()
+    # SRSP of the first is in, but it is not confirmed yet
+    assert api._uart.send.call_count == 1
+
+    api.frames_received([UnpiFrame(2, 4, 0x80, b"\x00\x01\x01")])
+    await settle()
+    assert api._uart.send.call_count == 2
+    api.frames_received([UnpiFrame(3, 4, 1, b"\x00")])
+    await second
+    assert api.credit_stats.sent == 2
+
+
+@pytest.mark.asyncio
+async def test_api_confirm_with_response(api):
+    first = asyncio.ensure_future(data_request(api, 1))
+    second = asyncio.ensure_future(data_request(api, 2))
+    await settle()
+    # SRSP and dataConfirm parsed from the same chunk
+    api.frames_received(
+        [UnpiFrame(3, 4, 1, b"\x00"), UnpiFrame(2, 4, 0x80, b"\x00\x01\x01")]
+    )
+    await first
+    await settle()
+    assert api.credit_stats.confirmed == 1
+    assert api._uart.send.call_count == 2
+
+    api.frames_received([UnpiFrame(3, 4, 1, b"\x00")])
+    await second
+    assert api._credits.outstanding == 1
+
+
+@pytest.mark.asyncio
+async def test_api_rejected_request_releases_credit(api):
+    first = asyncio.ensure_future(data_request(api, 1))
+    second = asyncio.ensure_future(data_request(api, 2))
+    await settle()
+    # no dataConfirm follows a failed SRSP
+    api.frames_received([UnpiFrame(3, 4, 1, b"\x10")])
+    with pytest.raises(zigpy_cc.exception.CommandError):
+        await first
+    await settle()
+    assert api._uart.send.call_count == 2
+    second.cancel()
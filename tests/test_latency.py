@@ -0,0 +1,58 @@
+import pytest
+
+from zigpy_cc.latency import MIN_SAMPLES, LatencyEstimator
+
+KEY = ("SYS", "ping")
+
+
+def test_static_until_enough_samples():
+    estimator = LatencyEstimator(100)
+    assert estimator.timeout(KEY, 6000) == 6000
+    for _ in range(MIN_SAMPLES - 1):
+        estimator.sample(KEY, 20, 6000)
+    assert estimator.timeout(KEY, 6000) == 6000
+    estimator.sample(KEY, 20, 6000)
+    assert estimator.timeout(KEY, 6000) < 6000
+
+
+def test_rto():
+    estimator = LatencyEstimator(1)
+    estimator.sample(KEY, 100, 6000)
+    stats = estimator.stats[KEY]
+    assert (stats.srtt, stats.rttvar, stats.rto) == (100, 50, 300)
+
+    estimator.sample(KEY, 200, 6000)
+    assert stats.rttvar == pytest.approx(0.75 * 50 + 0.25 * 100)
+    assert stats.srtt == pytest.approx(0.875 * 100 + 0.125 * 200)
+    assert stats.rto == pytest.approx(stats.srtt + 4 * stats.rttvar)
+    assert stats.samples == 2
+
+
+def test_clamped():
+    estimator = LatencyEstimator(500, 2000)
+    for _ in range(MIN_SAMPLES):
+        estimator.sample(KEY, 10, 6000)
+    assert estimator.timeout(KEY, 6000) == 500
+
+    for _ in range(10):
+        estimator.sample(KEY, 5000, 6000)
+    assert estimator.timeout(KEY, 6000) == 2000
+    # the static timeout stays the upper bound
+    assert estimator.timeout(KEY, 1000) == 1000
+
+
+def test_backoff():
+    estimator = LatencyEstimator(100)
+    for _ in range(MIN_SAMPLES):
+        estimator.sample(KEY, 100, 6000)
+    rto = estimator.timeout(KEY, 6000)
+
+    estimator.timed_out(KEY, 6000)
+    assert estimator.timeout(KEY, 6000) == 2 * rto
+    for _ in range(10):
+        estimator.timed_out(KEY, 6000)
+    assert estimator.timeout(KEY, 6000) == 6000
+    assert estimator.stats[KEY].timeouts == 11
+
+    estimator.timed_out(("SYS", "version"), 6000)
+    assert estimator.timeout(("SYS", "version"), 6000) == 6000
@@ -0,0 +1,170 @@
+import asyncio
+
+from asynctest import mock
+import pytest
+
+from zigpy_cc import types as t
+from zigpy_cc.scheduler import Priority, Scheduler, classify
+from zigpy_cc.zpi_object import ZpiObject
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def queue(scheduler, order, name, priority, key=None):
+    async def run():
+        await scheduler.acquire(priority, 1, key)
+        order.append(name)
+
+    return asyncio.ensure_future(run())
+
+
+@pytest.mark.asyncio
+async def test_priority_order():
+    scheduler = Scheduler(1)
+    order = []
+    await scheduler.acquire(Priority.INTERACTIVE)
+
+    tasks = [
+        queue(scheduler, order, "bulk", Priority.BULK),
+        queue(scheduler, order, "interactive", Priority.INTERACTIVE),
+        queue(scheduler, order, "control", Priority.CONTROL),
+    ]
+    await settle()
+    assert scheduler.stats[Priority.BULK].depth == 1
+
+    for _ in tasks:
+        scheduler.release()
+        await settle()
+    assert order == ["control", "interactive", "bulk"]
+
+    stats = scheduler.stats[Priority.BULK]
+    assert stats.depth == 0 and stats.max_depth == 1 and stats.granted == 1
+    assert scheduler.stats[Priority.INTERACTIVE].granted == 2
+
+
+@pytest.mark.asyncio
+async def test_aging():
+    scheduler = Scheduler(1)
+    order = []
+    await scheduler.acquire(Priority.BULK)
+
+    loop = asyncio.get_event_loop()
+    with mock.patch.object(loop, "time", return_value=100.0):
+        bulk = queue(scheduler, order, "bulk", Priority.BULK)
+        await settle()
+    # queued long enough to outrank a fresh control request
+    with mock.patch.object(loop, "time", return_value=106.0):
+        control = queue(scheduler, order, "control", Priority.CONTROL)
+        await settle()
+        scheduler.release()
+        await settle()
+        scheduler.release()
+        await settle()
+
+    assert bulk.done() and control.done()
+    assert order == ["bulk", "control"]
+    assert scheduler.stats[Priority.BULK].max_wait == 6.0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_skipped():
+    scheduler = Scheduler(1)
+    order = []
+    await scheduler.acquire(Priority.CONTROL)
+
+    cancelled = queue(scheduler, order, "cancelled", Priority.CONTROL)
+    other = queue(scheduler, order, "other", Priority.BULK)
+    await settle()
+    cancelled.cancel()
+    await settle()
+    assert scheduler.stats[Priority.CONTROL].depth == 0
+
+    scheduler.release()
+    await settle()
+    assert other.done()
+    assert order == ["other"]
+
+
+@pytest.mark.asyncio
+async def test_reset_takes_all_slots():
+    scheduler = Scheduler(2)
+    order = []
+    await scheduler.acquire(Priority.INTERACTIVE)
+
+    async def reset():
+        await scheduler.acquire(Priority.CONTROL, 2)
+        order.append("reset")
+
+    task = asyncio.ensure_future(reset())
+    await settle()
+    assert not task.done()
+    scheduler.release()
+    await settle()
+    assert order == ["reset"]
+
+
+@pytest.mark.asyncio
+async def test_same_key_one_at_a_time():
+    scheduler = Scheduler(2)
+    order = []
+    await scheduler.acquire(Priority.INTERACTIVE, 1, "a")
+
+    bulk = queue(scheduler, order, "bulk a", Priority.BULK, "a")
+    other = queue(scheduler, order, "b", Priority.INTERACTIVE, "b")
+    await settle()
+    # the free slot goes to the other key
+    assert order == ["b"]
+    interactive = queue(scheduler, order, "interactive a", Priority.INTERACTIVE, "a")
+    await settle()
+    assert not bulk.done() and not interactive.done()
+
+    scheduler.release(1, "b")
+    await settle()
+    assert order == ["b"]
+    scheduler.release(0, "a")
+    await settle()
+    # queued later, but ranked before the bulk request of its key
+    assert order == ["b", "interactive a"]
+    scheduler.release(1, "a")
+    await settle()
+    assert order == ["b", "interactive a", "bulk a"]
+    assert other.done()
+
+
+@pytest.mark.parametrize(
+    "subsystem, command, payload, priority",
+    [
+        (t.Subsystem.SYS, "ping", {}, Priority.CONTROL),
+        (t.Subsystem.UTIL, "ledControl", {"ledid": 1, "mode": 0}, Priority.CONTROL),
+        (t.Subsystem.ZDO, "mgmtLqiReq", {"dstaddr": 0, "startindex": 0}, Priority.BULK),
+        (t.Subsystem.SYS, "osalNvRead", {"id": 1, "offset": 0}, Priority.INTERACTIVE),
+    ],
+)
+def test_classify(subsystem, command, payload, priority):
+    obj = ZpiObject.from_command(subsystem, command, payload)
+    assert classify(obj) == priority
+
+
+@pytest.mark.parametrize(
+    "cluster, priority", [(6, Priority.INTERACTIVE), (0x19, Priority.BULK)]
+)
+def test_classify_ota(cluster, priority):
+    obj = ZpiObject.from_command(
+        t.Subsystem.AF,
+        "dataRequest",
+        {
+            "dstaddr": 0x1234,
+            "destendpoint": 1,
+            "srcendpoint": 1,
+            "clusterid": cluster,
+            "transid": 1,
+            "options": 0,
+            "radius": 30,
+            "len": 3,
+            "data": b"\x00\x01\x00",
+        },
+    )
+    assert classify(obj) == priority
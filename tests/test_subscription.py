@@ -0,0 +1,135 @@
+import asyncio
+
+from asynctest import mock
+import pytest
+
+from zigpy_cc import types as t
+import zigpy_cc.api
+import zigpy_cc.config
+from zigpy_cc.subscription import BLOCK
+from zigpy_cc.uart import UnpiFrame
+
+DEVICE_CONFIG = zigpy_cc.config.SCHEMA_DEVICE(
+    {zigpy_cc.config.CONF_DEVICE_PATH: "/dev/null"}
+)
+
+
+def src_rtg_ind(dstaddr):
+    return UnpiFrame(2, 5, 0xC4, dstaddr.to_bytes(2, "little") + b"\x00")
+
+
+@pytest.fixture
+def api():
+    api = zigpy_cc.api.API(DEVICE_CONFIG)
+    api._uart = mock.MagicMock()
+    return api
+
+
+@pytest.mark.asyncio
+async def test_subscribe(api):
+    subscription = api.subscribe(t.Subsystem.ZDO, "srcRtgInd")
+    api.frames_received([src_rtg_ind(1), src_rtg_ind(2)])
+
+    received = []
+
+    async def consume():
+        async for obj in subscription:
+            received.append(obj.payload["dstaddr"])
+
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(0)
+    api.frames_received([src_rtg_ind(3)])
+    await asyncio.sleep(0)
+    assert received == [1, 2, 3]
+
+    subscription.close()
+    await task
+    api.frames_received([src_rtg_ind(4)])
+    assert received == [1, 2, 3]
+    assert api._handlers[(t.Subsystem.ZDO, "srcRtgInd")] == [api._handle_srcRtgInd]
+
+
+@pytest.mark.asyncio
+async def test_subscribe_payload_filter(api):
+    with api.subscribe(t.Subsystem.ZDO, "srcRtgInd", {"dstaddr": 2}) as subscription:
+        api.frames_received([src_rtg_ind(1), src_rtg_ind(2)])
+        assert (await subscription.__anext__()).payload["dstaddr"] == 2
+        assert len(subscription) == 0
+
+
+@pytest.mark.asyncio
+async def test_subscribe_drop_oldest(api):
+    subscription = api.subscribe(t.Subsystem.ZDO, "srcRtgInd", maxsize=2)
+    api.frames_received([src_rtg_ind(i) for i in range(5)])
+    assert len(subscription) == 2
+    assert subscription.stats.received == 5
+    assert subscription.stats.dropped == 3
+
+    subscription.close()
+    assert [obj.payload["dstaddr"] async for obj in subscription] == [3, 4]
+
+
+@pytest.mark.asyncio
+async def test_subscribe_block(api):
+    subscription = api.subscribe(
+        t.Subsystem.ZDO, "srcRtgInd", maxsize=4, overflow=BLOCK
+    )
+    other = api.subscribe(t.Subsystem.ZDO, "srcRtgInd", maxsize=4, overflow=BLOCK)
+    api.frames_received([src_rtg_ind(i) for i in range(5)])
+    assert api._uart.pause_reading.call_count == 1
+    assert len(subscription) == 5
+    assert subscription.stats.dropped == 0
+
+    for _ in range(3):
+        await subscription.__anext__()
+    # still paused for the other subscriber
+    assert api._uart.resume_reading.call_count == 0
+    other.close()
+    assert api._uart.resume_reading.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_subscribe_block_request(api):
+    subscription = api.subscribe(
+        t.Subsystem.ZDO, "srcRtgInd", maxsize=2, overflow=BLOCK
+    )
+    api.frames_received([src_rtg_ind(i) for i in range(3)])
+    assert api._uart.pause_reading.call_count == 1
+
+    async def consume():
+        # the consumer asks the adapter before draining its queue
+        await subscription.__anext__()
+        return await api.request(t.Subsystem.SYS, "ping", {})
+
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(0)
+    assert api._uart.resume_reading.call_count == 1
+    api.frames_received([src_rtg_ind(3), UnpiFrame(3, 1, 1, b"\x79\x01")])
+    assert (await task).command == "ping"
+    assert len(subscription) == 3
+    # full again and no request pending
+    assert api._uart.pause_reading.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_subscribe_block_waiter_pending(api):
+    subscription = api.subscribe(
+        t.Subsystem.ZDO, "srcRtgInd", maxsize=2, overflow=BLOCK
+    )
+    api.wait_for(t.CommandType.SRSP, t.Subsystem.SYS, "ping", {})
+    api.frames_received([src_rtg_ind(i) for i in range(3)])
+    assert api._uart.pause_reading.call_count == 0
+    assert len(subscription) == 3
+
+
+def test_subscribe_unknown_overflow(api):
+    with pytest.raises(ValueError):
+        api.subscribe(t.Subsystem.ZDO, "srcRtgInd", overflow="wait")
+
+
+@pytest.mark.asyncio
+async def test_close_ends_subscriptions(api):
+    subscription = api.subscribe(t.Subsystem.ZDO, "srcRtgInd")
+    api.close()
+    with pytest.raises(StopAsyncIteration):
+        await subscription.__anext__()
@@ -1,9 +1,14 @@
+import asyncio
+import socket
+import threading
+
 from asynctest import mock
 
 import pytest
 import serial_asyncio
+import voluptuous as vol
 
-from zigpy_cc import uart
+from zigpy_cc import capture, uart
 import zigpy_cc.config
 
 DEVICE_CONFIG = zigpy_cc.config.SCHEMA_DEVICE(
@@ -15,6 +20,13 @@ def eq(a, b):
     assert str(a) == str(b)
 
 
+def received(gw):
+    frames = []
+    for call in gw._api.frames_received.call_args_list:
+        frames += call[0][0]
+    return frames
+
+
 @pytest.fixture(scope="function")
 def gw():
     gw = uart.Gateway(mock.MagicMock())
@@ -37,6 +49,69 @@ async def test_connect(monkeypatch):
     await uart.connect(DEVICE_CONFIG, api)
 
 
+@pytest.mark.asyncio
+async def test_connect_handshake(monkeypatch):
+    api = mock.MagicMock()
+    transport = mock.MagicMock()
+    ping = uart.UnpiFrame(1, 1, 1, b"").to_buffer()
+    ping_rsp = uart.UnpiFrame(3, 1, 1, b"\x79\x07").to_buffer()
+
+    async def mock_conn(loop, protocol_factory, **kwargs):
+        protocol = protocol_factory()
+
+        def write(data):
+            if ping in data:
+                loop.call_soon(protocol.data_received, ping_rsp)
+
+        transport.write.side_effect = write
+        loop.call_soon(protocol.connection_made, transport)
+        return None, protocol
+
+    monkeypatch.setattr(serial_asyncio, "create_serial_connection", mock_conn)
+
+    loop = asyncio.get_event_loop()
+    start = loop.time()
+    await uart.connect(DEVICE_CONFIG, api)
+    assert loop.time() - start < uart.BOOTLOADER_TIMEOUT / 2
+    assert transport.write.call_args_list[0][0][0] == b"\xef"
+
+
+@pytest.mark.asyncio
+async def test_skip_bootloader_no_answer(gw):
+    assert await gw.skip_bootloader(timeout=0.3, interval=0.1) is False
+    pings = [c for c in gw._transport.write.call_args_list if c[0][0] != b"\xef"]
+    assert len(pings) == 3
+    assert gw._handshake is None
+
+
+@pytest.mark.asyncio
+async def test_skip_bootloader_stale_pings(gw):
+    rsp = uart.UnpiFrame(3, 1, 1, b"\x79\x07")
+    version = uart.UnpiFrame(3, 1, 2, b"\x02\x00\x02\x06\x03")
+    loop = asyncio.get_event_loop()
+    # the ZNP comes up answering every ping sent so far, one after another
+    loop.call_later(0.25, gw.frames_received, [rsp])
+    loop.call_later(0.27, gw.frames_received, [rsp, rsp, version])
+    assert await gw.skip_bootloader(timeout=1, interval=0.1) is True
+    pings = [c for c in gw._transport.write.call_args_list if c[0][0] != b"\xef"]
+    assert len(pings) == 3
+    assert gw._handshake is None
+    # none of the ping responses reach the API
+    assert gw._api.frames_received.call_args_list == [mock.call([version])]
+
+
+@pytest.mark.asyncio
+async def test_skip_bootloader_unanswered_pings(gw):
+    loop = asyncio.get_event_loop()
+    loop.call_later(0.15, gw.frames_received, [uart.UnpiFrame(3, 1, 1, b"")])
+    start = loop.time()
+    assert await gw.skip_bootloader(timeout=1, interval=0.1) is True
+    # the first ping went to the bootloader, its answer is not waited for long
+    assert loop.time() - start < 0.3
+    assert gw._handshake is None
+    assert gw._api.frames_received.call_count == 0
+
+
 def test_write(gw):
     data = b"\x00"
     gw.write(data)
@@ -44,6 +119,90 @@ def test_write(gw):
     assert gw._transport.write.called_once_with(data)
 
 
+@pytest.mark.asyncio
+async def test_send_coalesced(gw):
+    ping = uart.UnpiFrame(1, 1, 1, b"")
+    version = uart.UnpiFrame(1, 1, 2, b"")
+    gw.send(ping)
+    gw.send(version)
+    assert gw._transport.write.call_count == 0
+    assert gw.tx_stats.queued_bytes == 10
+
+    await asyncio.sleep(0)
+    assert gw._transport.write.call_count == 1
+    gw._transport.write.assert_called_once_with(ping.to_buffer() + version.to_buffer())
+    assert gw.tx_stats.frames == 2
+    assert gw.tx_stats.writes == 1
+    assert gw.tx_stats.queued_bytes == 0
+
+
+@pytest.mark.asyncio
+async def test_send_backpressure(gw):
+    ping = uart.UnpiFrame(1, 1, 1, b"")
+    gw.pause_writing()
+    gw.send(ping)
+    gw.send(ping)
+    await asyncio.sleep(0)
+    assert gw._transport.write.call_count == 0
+    assert gw.tx_stats.queued_bytes == 10
+
+    gw.resume_writing()
+    gw._transport.write.assert_called_once_with(ping.to_buffer() * 2)
+    assert gw.tx_stats.pauses == 1
+    assert gw.tx_stats.max_drain_latency >= 0
+
+
+@pytest.mark.asyncio
+async def test_send_high_water(gw):
+    gw._open = True
+    ping = uart.UnpiFrame(1, 1, 1, b"")
+    gw.pause_writing()
+    while gw.writable:
+        gw.send(ping)
+    drain = asyncio.ensure_future(gw.drain())
+    await asyncio.sleep(0)
+    assert not drain.done()
+
+    gw.resume_writing()
+    await asyncio.sleep(0)
+    assert drain.done()
+    assert gw.writable
+
+
+@pytest.mark.asyncio
+async def test_drain_connection_lost(gw):
+    gw._open = True
+    gw.pause_writing()
+    gw.write(bytes(uart.SEND_HIGH_WATER + 1))
+    drain = asyncio.ensure_future(gw.drain())
+    await asyncio.sleep(0)
+    gw.connection_lost(None)
+    await drain
+    assert gw._api.connection_lost.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_write_behind_queued_frames(gw):
+    ping = uart.UnpiFrame(1, 1, 1, b"")
+    gw.send(ping)
+    gw.write(b"\xef")
+    gw._transport.write.assert_called_once_with(ping.to_buffer() + b"\xef")
+
+    gw.pause_writing()
+    gw.write(b"\xef")
+    assert gw._transport.write.call_count == 1
+    gw.resume_writing()
+    assert gw._transport.write.call_args[0][0] == b"\xef"
+
+
+def test_close_flushes_queue(gw):
+    ping = uart.UnpiFrame(1, 1, 1, b"")
+    gw.send(ping)
+    gw.close()
+    gw._transport.write.assert_called_once_with(ping.to_buffer())
+    assert gw._transport.close.call_count == 1
+
+
 def test_close(gw):
     gw.close()
     assert gw._transport.close.call_count == 1
@@ -52,11 +211,11 @@ def test_close(gw):
 def test_data_received_chunk_frame(gw):
     data = b"\xfe\x0ea\x02\x02\x00\x02\x06\x03\x90\x154\x01\x02\x00\x00\x00\x00\xda"
     gw.data_received(data[:-4])
-    assert gw._api.data_received.call_count == 0
+    assert len(received(gw)) == 0
     gw.data_received(data[-4:])
-    assert gw._api.data_received.call_count == 1
+    assert len(received(gw)) == 1
     eq(
-        gw._api.data_received.call_args[0][0],
+        received(gw)[0],
         uart.UnpiFrame(3, 1, 2, data[4:-1], 14, 218),
     )
 
@@ -64,9 +223,9 @@ def test_data_received_chunk_frame(gw):
 def test_data_received_full_frame(gw):
     data = b"\xfe\x0ea\x02\x02\x00\x02\x06\x03\x90\x154\x01\x02\x01\x00\x00\x00\xdb"
     gw.data_received(data)
-    assert gw._api.data_received.call_count == 1
+    assert len(received(gw)) == 1
     eq(
-        gw._api.data_received.call_args[0][0],
+        received(gw)[0],
         uart.UnpiFrame(3, 1, 2, data[4:-1], 14, 219),
     )
 
@@ -74,13 +233,13 @@ def test_data_received_full_frame(gw):
 def test_data_received_incomplete_frame(gw):
     data = b"~\x00\x00"
     gw.data_received(data)
-    assert gw._api.data_received.call_count == 0
+    assert len(received(gw)) == 0
 
 
 def test_data_received_runt_frame(gw):
     data = b"\x02\x44\xC0"
     gw.data_received(data)
-    assert gw._api.data_received.call_count == 0
+    assert len(received(gw)) == 0
 
 
 def test_data_received_extra(gw):
@@ -89,14 +248,111 @@ def test_data_received_extra(gw):
         b"\xfe\x00"
     )
     gw.data_received(data)
-    assert gw._api.data_received.call_count == 1
+    assert len(received(gw)) == 1
     assert gw._parser.buffer == b"\xfe\x00"
 
 
 def test_data_received_wrong_checksum(gw):
     data = b"\xfe\x0ea\x02\x02\x00\x02\x06\x03\x90\x154\x01\x02\x01\x00\x00\x00\xdc"
     gw.data_received(data)
-    assert gw._api.data_received.call_count == 0
+    assert len(received(gw)) == 0
+    assert gw.rx_stats.bad_checksums == 1
+    assert gw.rx_stats.bytes_dropped == len(data)
+
+
+def test_data_received_multiple_frames(gw):
+    frame = b"\xfe\x0ea\x02\x02\x00\x02\x06\x03\x90\x154\x01\x02\x01\x00\x00\x00\xdb"
+    gw.data_received(frame * 3 + frame[:5])
+    assert gw._api.frames_received.call_count == 1
+    assert len(received(gw)) == 3
+    assert gw._parser.buffer == frame[:5]
+
+
+def test_data_received_garbage_before_sof(gw):
+    frame = b"\xfe\x0ea\x02\x02\x00\x02\x06\x03\x90\x154\x01\x02\x01\x00\x00\x00\xdb"
+    gw.data_received(b"\x00\x11" + frame)
+    assert len(received(gw)) == 1
+    assert gw._parser.buffer == b""
+
+
+def test_parser_byte_by_byte():
+    frame = b"\xfe\x0ea\x02\x02\x00\x02\x06\x03\x90\x154\x01\x02\x01\x00\x00\x00\xdb"
+    parser = uart.Parser()
+    frames = []
+    for b in frame:
+        frames += parser.write(bytes([b]))
+    assert len(frames) == 1
+    eq(frames[0], uart.UnpiFrame(3, 1, 2, frame[4:-1], 14, 219))
+
+
+def test_parser_empty_frame():
+    # SRSP SYS ping without payload data
+    parser = uart.Parser()
+    frames = parser.write(b"\xfe\x00\x61\x01\x60")
+    assert len(frames) == 1
+    eq(frames[0], uart.UnpiFrame(3, 1, 1, b"", 0, 0x60))
+
+
+def test_data_received_unknown_type(gw):
+    frame = b"\xfe\x0ea\x02\x02\x00\x02\x06\x03\x90\x154\x01\x02\x01\x00\x00\x00\xdb"
+    # valid checksum, but command type 7 and subsystem 31 do not exist
+    unknown = b"\xfe\x00\xff\x01\xfe"
+    gw.data_received(unknown + frame + frame)
+    assert len(received(gw)) == 2
+    assert gw._parser.buffer == b""
+    assert gw.rx_stats.unknown_types == 1
+    assert gw.rx_stats.bytes_dropped == len(unknown)
+
+
+def test_data_received_resync_after_bad_length(gw):
+    frame = b"\xfe\x0ea\x02\x02\x00\x02\x06\x03\x90\x154\x01\x02\x01\x00\x00\x00\xdb"
+    # corrupted length byte claims a frame longer than the frames that follow it
+    corrupt = b"\xfe\x30a\x02\x02"
+    gw.data_received(corrupt + frame + frame + b"\x00" * 20)
+    assert len(received(gw)) == 2
+    assert gw.rx_stats.bad_checksums == 1
+    assert gw.rx_stats.resyncs == 2
+    assert gw.rx_stats.bytes_dropped == len(corrupt) + 20
+
+
+@pytest.mark.asyncio
+async def test_data_received_bad_length_idle(gw, monkeypatch):
+    monkeypatch.setattr(uart, "PARTIAL_FRAME_TIMEOUT", 0.01)
+    gw._loop = asyncio.get_event_loop()
+    frame = b"\xfe\x0ea\x02\x02\x00\x02\x06\x03\x90\x154\x01\x02\x01\x00\x00\x00\xdb"
+    # nothing follows on a quiet link, the frame waits for the line to go idle
+    gw.data_received(b"\xfe\x30a\x02\x02" + frame)
+    assert len(received(gw)) == 0
+    await asyncio.sleep(0.05)
+    assert len(received(gw)) == 1
+    eq(received(gw)[0], uart.UnpiFrame(3, 1, 2, frame[4:-1], 14, 219))
+    assert gw._parser.buffer == b""
+    assert gw.rx_stats.bytes_dropped == 5
+
+
+@pytest.mark.asyncio
+async def test_data_received_split_frame_with_sof(gw, monkeypatch):
+    monkeypatch.setattr(uart, "PARTIAL_FRAME_TIMEOUT", 0.01)
+    gw._loop = asyncio.get_event_loop()
+    # AF incomingMsg whose data holds the bytes of a complete SRSP SYS ping
+    data = bytes(16) + b"\x05\xfe\x00\x61\x01\x60"
+    frame = uart.UnpiFrame(2, 4, 0x81, data).to_buffer()
+    cut = frame.index(b"\xfe\x00\x61\x01\x60") + 5
+    gw.data_received(frame[:cut])
+    assert len(received(gw)) == 0
+    gw.data_received(frame[cut:])
+    await asyncio.sleep(0.05)
+    assert [f.to_buffer() for f in received(gw)] == [frame]
+    assert gw.rx_stats.bytes_dropped == 0
+
+
+def test_data_received_oversize_length(gw):
+    frame = b"\xfe\x0ea\x02\x02\x00\x02\x06\x03\x90\x154\x01\x02\x01\x00\x00\x00\xdb"
+    gw.data_received(b"\xfe\xff\x00" + frame)
+    assert len(received(gw)) == 1
+    assert gw.rx_stats.oversize_lengths == 1
+    assert gw.rx_stats.bytes_dropped == 3
+    assert gw.rx_stats.resyncs == 1
 
 
 @pytest.mark.skip("TODO")
@@ -137,8 +393,9 @@ def test_checksum():
 @mock.patch.object(serial_asyncio, "create_serial_connection")
 async def test_flow_control(conn_mock, control, xonxoff, rtscts):
     async def set_connected(loop, proto_factory, **kwargs):
-        proto_factory()._connected_future.set_result(True)
-        return mock.sentinel.a, mock.MagicMock()
+        protocol = proto_factory()
+        protocol.connection_made(mock.MagicMock())
+        return mock.sentinel.a, protocol
 
     conn_mock.side_effect = set_connected
     await uart.connect(
@@ -146,3 +403,164 @@ async def test_flow_control(conn_mock, control, xonxoff, rtscts):
     )
     assert conn_mock.call_args[1]["xonxoff"] == xonxoff
     assert conn_mock.call_args[1]["rtscts"] == rtscts
+
+
+@pytest.mark.parametrize(
+    "path", ("socket://192.168.1.5:6638", "tcp://localhost:6638", "/dev/null")
+)
+def test_device_path_valid(path):
+    config = zigpy_cc.config.SCHEMA_DEVICE({zigpy_cc.config.CONF_DEVICE_PATH: path})
+    assert config[zigpy_cc.config.CONF_DEVICE_PATH] == path
+
+
+@pytest.mark.parametrize(
+    "path", ("socket://192.168.1.5", "http://localhost:6638", "/dev/missing")
+)
+def test_device_path_invalid(path):
+    with pytest.raises(vol.Invalid):
+        zigpy_cc.config.SCHEMA_DEVICE({zigpy_cc.config.CONF_DEVICE_PATH: path})
+
+
+@pytest.mark.asyncio
+async def test_connect_socket():
+    version = uart.UnpiFrame(3, 1, 2, b"\x02\x00\x02\x06\x03\x90\x154\x01")
+    received = asyncio.Queue()
+
+    async def emulator(reader, writer):
+        while True:
+            data = await reader.read(256)
+            if not data:
+                break
+            await received.put(data)
+            if uart.UnpiFrame(1, 1, 1, b"").to_buffer() in data:
+                writer.write(uart.UnpiFrame(3, 1, 1, b"\x79\x07").to_buffer())
+            if uart.UnpiFrame(1, 1, 2, b"").to_buffer() in data:
+                writer.write(version.to_buffer())
+
+    server = await asyncio.start_server(emulator, "127.0.0.1", 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    api = mock.MagicMock()
+
+    gw = await uart.connect(
+        {
+            **DEVICE_CONFIG,
+            zigpy_cc.config.CONF_DEVICE_PATH: "socket://127.0.0.1:%d" % port,
+        },
+        api,
+    )
+    sock = gw._transport.get_extra_info("socket")
+    assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+    assert (await received.get()).startswith(b"\xef")
+    # handshake ping answered, its response is not passed on
+    assert api.frames_received.call_count == 0
+
+    gw.send(uart.UnpiFrame(1, 1, 2, b""))
+    for _ in range(100):
+        if api.frames_received.call_count == 1:
+            break
+        await asyncio.sleep(0.01)
+    frame = api.frames_received.call_args[0][0][0]
+    assert frame.to_buffer() == version.to_buffer()
+
+    gw.close()
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_threaded_serial_connection():
+    api = mock.MagicMock()
+    delivered = []
+    api.frames_received.side_effect = lambda frames: delivered.append(
+        (threading.current_thread(), frames)
+    )
+    loop = asyncio.get_event_loop()
+    gw = uart.Gateway(api)
+
+    # loop:// echoes everything written back to the reader
+    transport = await uart.create_threaded_serial_connection(
+        loop, lambda: gw, "loop://"
+    )
+    assert gw._transport is transport
+
+    frames = [uart.UnpiFrame(1, 1, 1, b""), uart.UnpiFrame(1, 1, 2, b"\x01\x02")]
+    for frame in frames:
+        gw.send(frame)
+    for _ in range(100):
+        if sum(len(f) for _, f in delivered) == 2:
+            break
+        await asyncio.sleep(0.01)
+
+    assert all(thread is threading.main_thread() for thread, _ in delivered)
+    received = [frame for _, batch in delivered for frame in batch]
+    assert [f.to_buffer() for f in received] == [f.to_buffer() for f in frames]
+
+    gw.close()
+    for _ in range(100):
+        if not transport._reader.is_alive():
+            break
+        await asyncio.sleep(0.01)
+    assert not transport._reader.is_alive()
+    assert not transport._writer.is_alive()
+    assert api.connection_lost.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_threaded_serial_capture(tmp_path):
+    api = mock.MagicMock()
+    loop = asyncio.get_event_loop()
+    gw = uart.Gateway(api)
+    transport = await uart.create_threaded_serial_connection(
+        loop, lambda: gw, "loop://"
+    )
+    path = str(tmp_path / "capture.bin")
+    gw.start_capture(path, 64 * 1024)
+
+    # loop:// echoes the garbage and the frame back
+    frame = uart.UnpiFrame(1, 1, 1, b"")
+    gw.write(b"\x13\x37")
+    gw.send(frame)
+    for _ in range(100):
+        if api.frames_received.call_count:
+            break
+        await asyncio.sleep(0.01)
+    gw.close()
+    for _ in range(100):
+        if not transport._reader.is_alive():
+            break
+        await asyncio.sleep(0.01)
+
+    records = list(capture.read_capture(path))
+    received = b"".join(r.data for r in records if r.direction == capture.RX)
+    assert received == b"\x13\x37" + frame.to_buffer()
+
+
+@pytest.mark.asyncio
+@mock.patch.object(uart, "create_threaded_serial_connection")
+@mock.patch.object(serial_asyncio, "create_serial_connection")
+async def test_connect_serial_thread(conn_mock, threaded_mock):
+    async def set_connected(loop, proto_factory, **kwargs):
+        protocol = proto_factory()
+        protocol.connection_made(mock.MagicMock())
+
+    threaded_mock.side_effect = set_connected
+    await uart.connect(
+        {**DEVICE_CONFIG, zigpy_cc.config.CONF_SERIAL_THREAD: True}, mock.MagicMock()
+    )
+    assert threaded_mock.call_count == 1
+    assert conn_mock.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_partial_frame_kept_while_paused(gw, monkeypatch):
+    monkeypatch.setattr(uart, "PARTIAL_FRAME_TIMEOUT", 0.01)
+    gw._loop = asyncio.get_event_loop()
+    frame = b"\xfe\x0ea\x02\x02\x00\x02\x06\x03\x90\x154\x01\x02\x01\x00\x00\x00\xdb"
+    gw.data_received(frame[:8])
+    gw.pause_reading()
+    await asyncio.sleep(0.05)
+    assert gw._parser.buffer == frame[:8]
+    gw.resume_reading()
+    gw.data_received(frame[8:])
+    assert len(received(gw)) == 1
+    assert gw.rx_stats.bytes_dropped == 0
@@ -0,0 +1,40 @@
+import pytest
+
+from zigpy_cc import types as t
+from zigpy_cc.definition import Definition
+from zigpy_cc.uart import UnpiFrame
+from zigpy_cc.zpi_object import ZpiObject, get_command, get_command_by_id
+
+
+def test_index_matches_definition():
+    for subsystem, commands in Definition.items():
+        for cmd in commands:
+            first_by_name = next(c for c in commands if c["name"] == cmd["name"])
+            first_by_id = next(c for c in commands if c["ID"] == cmd["ID"])
+            assert get_command(subsystem, cmd["name"]) is first_by_name
+            assert get_command_by_id(subsystem, cmd["ID"]) is first_by_id
+            assert get_command_by_id(subsystem, cmd["ID"], cmd["type"]) is cmd
+
+
+def test_duplicate_names():
+    sapi = get_command(t.Subsystem.SAPI, "getDeviceInfo")
+    util = get_command(t.Subsystem.UTIL, "getDeviceInfo")
+    assert sapi is not util
+    assert sapi["ID"] == 6 and util["ID"] == 0
+
+
+def test_srsp_lookup():
+    cmd = get_command_by_id(t.Subsystem.SYS, 2, t.CommandType.SRSP)
+    assert cmd["name"] == "version"
+
+    obj = ZpiObject.from_unpi_frame(UnpiFrame(3, 1, 1, b"\x79\x01"))
+    assert obj.command == "ping"
+    assert obj.payload == {"capabilities": 0x0179}
+
+
+def test_unknown_command():
+    assert get_command(t.Subsystem.SYS, "nope") is None
+    with pytest.raises(KeyError):
+        ZpiObject.from_command(t.Subsystem.SYS, "nope", {})
+    with pytest.raises(KeyError):
+        ZpiObject.from_unpi_frame(UnpiFrame(3, 1, 0xEE, b""))
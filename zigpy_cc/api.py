@@ -1,21 +1,128 @@
 import asyncio
+import heapq
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import serial
 import zigpy.exceptions
+import zigpy.types
 
 from zigpy_cc import uart
-from zigpy_cc.config import CONF_DEVICE_PATH, SCHEMA_DEVICE
+from zigpy_cc.config import (
+    BAUDRATE_CANDIDATES,
+    CONF_DATA_CREDITS,
+    CONF_DEVICE_BAUDRATE,
+    CONF_DEVICE_BAUDRATE_AUTO,
+    CONF_DEVICE_IEEE,
+    CONF_DEVICE_PATH,
+    CONF_SREQ_IN_FLIGHT,
+    CONF_SREQ_IN_FLIGHT_DEFAULT,
+    CONF_SREQ_TIMEOUT_MAX,
+    CONF_SREQ_TIMEOUT_MIN,
+    CONF_SREQ_TIMEOUT_MIN_DEFAULT,
+    SCHEMA_DEVICE,
+)
+from zigpy_cc.credits import CreditStats, DataCredits
 from zigpy_cc.definition import Definition
-from zigpy_cc.exception import CommandError
+from zigpy_cc.exception import CommandError, RequestAborted
+from zigpy_cc.latency import LatencyEstimator, LatencyStats
+from zigpy_cc.scheduler import (
+    DATA_REQUESTS,
+    Priority,
+    QueueStats,
+    Scheduler,
+    classify,
+)
+from zigpy_cc.subscription import DROP_OLDEST, Subscription
 from zigpy_cc.types import CommandType, Repr, Subsystem, Timeouts
 from zigpy_cc.uart import Gateway
-from zigpy_cc.zpi_object import ZpiObject
+from zigpy_cc.zigbee.common import NvItemsIds
+from zigpy_cc.zpi_object import ZpiObject, get_command
 
 LOGGER = logging.getLogger(__name__)
 
 COMMAND_TIMEOUT = 2
+# shared deadline for probing every auto detected port, in seconds, extended by
+# COMMAND_TIMEOUT for every candidate when the baudrate is detected as well
+AUTO_DETECT_TIMEOUT = 5
+
+# static SRSP timeouts of commands slower than Timeouts.SREQ, in milliseconds
+SREQ_TIMEOUTS = {
+    (Subsystem.APP_CNF, "bdbStartCommissioning"): 20000,
+    (Subsystem.ZDO, "startupFromApp"): 20000,
+}
+
+# requests without side effects, identical ones in flight at the same time share
+# a single request to the adapter. ZDO requests are left out, zigpy sends each
+# one with its own sequence number and response waiter through request_raw
+IDEMPOTENT_COMMANDS = {
+    (Subsystem.SYS, "ping"),
+    (Subsystem.SYS, "version"),
+    (Subsystem.SYS, "getExtAddr"),
+    (Subsystem.SYS, "osalNvRead"),
+    (Subsystem.SYS, "osalNvLength"),
+    (Subsystem.SAPI, "readConfiguration"),
+    (Subsystem.UTIL, "getDeviceInfo"),
+    (Subsystem.UTIL, "getNvInfo"),
+}
+
+# seconds responses of these commands are served from the cache, until a reset,
+# a state change or a write to the adapter's NV memory invalidates them
+RESPONSE_CACHE_TTLS = {
+    (Subsystem.SYS, "version"): 3600,
+    (Subsystem.SYS, "getExtAddr"): 3600,
+    (Subsystem.SYS, "osalNvRead"): 600,
+    (Subsystem.SAPI, "readConfiguration"): 600,
+}
+# NV items only the host writes, the stack keeps updating others like the NIB
+STATIC_NV_ITEMS = {
+    NvItemsIds.LOGICAL_TYPE,
+    NvItemsIds.PANID,
+    NvItemsIds.EXTENDED_PAN_ID,
+    NvItemsIds.CHANLIST,
+    NvItemsIds.PRECFGKEY,
+    NvItemsIds.PRECFGKEYS_ENABLE,
+    NvItemsIds.ZDO_DIRECT_CB,
+    NvItemsIds.ZNP_HAS_CONFIGURED_ZSTACK1,
+    NvItemsIds.ZNP_HAS_CONFIGURED_ZSTACK3,
+}
+CACHE_INVALIDATING_COMMANDS = {
+    (Subsystem.SYS, "setExtAddr"),
+    (Subsystem.SYS, "osalNvItemInit"),
+    (Subsystem.SYS, "osalNvWrite"),
+    (Subsystem.SYS, "osalNvDelete"),
+    (Subsystem.SAPI, "writeConfiguration"),
+}
+
+# auto detected port by configured coordinator IEEE, kept across reconnects but
+# not across restarts of the process
+_detected_ports: Dict[Optional[zigpy.types.EUI64], str] = {}
+
+
+def _cache_ttl(obj: ZpiObject) -> Optional[float]:
+    key = (obj.subsystem, obj.command)
+    if (
+        key == (Subsystem.SYS, "osalNvRead")
+        and obj.payload["id"] not in STATIC_NV_ITEMS
+    ):
+        return None
+    return RESPONSE_CACHE_TTLS.get(key)
+
+
+def _detect_timeout(device_config: Dict[str, Any]) -> float:
+    """Seconds a port gets to answer, including a baudrate scan if needed"""
+    if device_config.get(CONF_DEVICE_BAUDRATE) == CONF_DEVICE_BAUDRATE_AUTO:
+        return AUTO_DETECT_TIMEOUT + len(BAUDRATE_CANDIDATES) * COMMAND_TIMEOUT
+    return AUTO_DETECT_TIMEOUT
+
+
+def _command_subsystems(command: str) -> List[Subsystem]:
+    """Subsystems defining a command of that name"""
+    return [
+        subsystem
+        for subsystem, commands in Definition.items()
+        if any(cmd["name"] == command for cmd in commands)
+    ]
 
 
 class Matcher(Repr):
@@ -42,9 +149,31 @@ class Waiter(Repr):
         self.future = asyncio.get_event_loop().create_future()
         self.timeout = timeout
         self.sequence = sequence
+        self.deadline = None
+        self.error: Optional[Exception] = None
+
+    @property
+    def expired(self) -> bool:
+        return isinstance(self.error, asyncio.TimeoutError)
 
     async def wait(self):
-        return await asyncio.wait_for(self.future, self.timeout / 1000)
+        try:
+            return await self.future
+        except asyncio.CancelledError:
+            if self.error is not None:
+                raise self.error from None
+            raise
+
+    def expire(self) -> None:
+        """Called by the registry once the deadline passed without a match"""
+        self.abort(asyncio.TimeoutError())
+
+    def abort(self, error: Exception) -> None:
+        # the future is cancelled rather than failed, so waiters nobody awaits
+        # don't log never retrieved exceptions; wait() raises the error instead
+        if not self.future.done():
+            self.error = error
+            self.future.cancel()
 
     def set_result(self, result) -> None:
         if self.future.cancelled():
@@ -71,23 +200,322 @@ class Waiter(Repr):
         return True
 
 
+class WaiterRegistry:
+    """Pending waiters, indexed by (command_type, subsystem, command) and by the
+    value of the first of INDEXED_PAYLOAD_KEYS their payload matches on.
+
+    Deadlines of all waiters live in one heap serviced by a single timer handle.
+    Popping a waiter leaves its heap entry behind, stale entries are skipped when
+    they come due and the heap is rebuilt once they outnumber the live ones."""
+
+    INDEXED_PAYLOAD_KEYS = ("transid", "srcaddr")
+    # rebuild the deadline heap when it holds this many more entries than waiters
+    COMPACT_SLACK = 64
+
+    def __init__(self) -> None:
+        self._waiters: Dict[int, Waiter] = {}
+        self._index: Dict[tuple, Dict[int, Waiter]] = {}
+        self._deadlines: List[Tuple[float, int]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _index_key(self, waiter: Waiter) -> tuple:
+        matcher = waiter.matcher
+        key = (int(matcher.command_type), int(matcher.subsystem), matcher.command)
+        if matcher.payload:
+            for field in self.INDEXED_PAYLOAD_KEYS:
+                if field in matcher.payload:
+                    return key + (field, matcher.payload[field])
+        return key
+
+    def __setitem__(self, waiter_id: int, waiter: Waiter) -> None:
+        self._waiters[waiter_id] = waiter
+        self._index.setdefault(self._index_key(waiter), {})[waiter_id] = waiter
+        if waiter.deadline is not None:
+            heapq.heappush(self._deadlines, (waiter.deadline, waiter_id))
+            if len(self._deadlines) > 2 * len(self._waiters) + self.COMPACT_SLACK:
+                self._compact()
+            self._schedule()
+
+    def _compact(self) -> None:
+        self._deadlines = [
+            (waiter.deadline, waiter_id)
+            for waiter_id, waiter in self._waiters.items()
+            if waiter.deadline is not None
+        ]
+        heapq.heapify(self._deadlines)
+
+    def _schedule(self) -> None:
+        if not self._deadlines:
+            return
+        deadline = self._deadlines[0][0]
+        if self._timer is not None:
+            if self._timer.when() <= deadline:
+                return
+            self._timer.cancel()
+        self._timer = asyncio.get_event_loop().call_at(deadline, self._expire)
+
+    def _expire(self) -> None:
+        self._timer = None
+        now = asyncio.get_event_loop().time()
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            deadline, waiter_id = heapq.heappop(deadlines)
+            waiter = self._waiters.get(waiter_id)
+            if waiter is None or waiter.deadline != deadline:
+                continue
+            self.pop(waiter_id)
+            matcher = waiter.matcher
+            LOGGER.warning(
+                "No response for: %s %s %s %s",
+                matcher.command_type.name,
+                matcher.subsystem.name,
+                matcher.command,
+                matcher.payload,
+            )
+            waiter.expire()
+        self._schedule()
+
+    def pop(self, waiter_id: int, *default) -> Waiter:
+        if waiter_id not in self._waiters:
+            if default:
+                return default[0]
+            raise KeyError(waiter_id)
+        waiter = self._waiters.pop(waiter_id)
+        key = self._index_key(waiter)
+        bucket = self._index[key]
+        del bucket[waiter_id]
+        if not bucket:
+            del self._index[key]
+        if not self._waiters:
+            self._deadlines.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        return waiter
+
+    def get(self, waiter_id: int, default=None) -> Optional[Waiter]:
+        return self._waiters.get(waiter_id, default)
+
+    def __contains__(self, waiter_id) -> bool:
+        return waiter_id in self._waiters
+
+    def __len__(self) -> int:
+        return len(self._waiters)
+
+    def __iter__(self):
+        return iter(self._waiters)
+
+    def values(self):
+        return self._waiters.values()
+
+    def match(self, obj: ZpiObject) -> List[Waiter]:
+        """Waiters matching obj, in the order they were registered"""
+        key = (int(obj.command_type), int(obj.subsystem), obj.command)
+        buckets = []
+        bucket = self._index.get(key)
+        if bucket:
+            buckets.append(bucket.values())
+        for field in self.INDEXED_PAYLOAD_KEYS:
+            if field in obj.payload:
+                try:
+                    bucket = self._index.get(key + (field, obj.payload[field]))
+                except TypeError:
+                    continue
+                if bucket:
+                    buckets.append(bucket.values())
+
+        if not buckets:
+            return []
+        if len(buckets) == 1:
+            candidates = buckets[0]
+        else:
+            candidates = heapq.merge(*buckets, key=lambda waiter: waiter.id)
+        return [waiter for waiter in candidates if waiter.match(obj)]
+
+
+class CacheStats(Repr):
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+
+class ResponseCache:
+    """Responses by request key, each valid until its expiry time"""
+
+    def __init__(self) -> None:
+        self._entries: Dict[tuple, Tuple[float, ZpiObject]] = {}
+        # bumped by clear(), responses requested before that are not stored
+        self.generation = 0
+        self.stats = CacheStats()
+
+    def get(self, key: tuple) -> Optional[ZpiObject]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > asyncio.get_event_loop().time():
+                self.stats.hits += 1
+                return entry[1]
+            del self._entries[key]
+        self.stats.misses += 1
+        return None
+
+    def put(self, key: tuple, response: ZpiObject, ttl: float, generation: int):
+        if generation == self.generation:
+            expires = asyncio.get_event_loop().time() + ttl
+            self._entries[key] = (expires, response)
+
+    def clear(self) -> None:
+        self.generation += 1
+        if self._entries:
+            self.stats.invalidations += 1
+            self._entries.clear()
+
+
 class API:
     _uart: Optional[Gateway]
 
     def __init__(self, device_config: Dict[str, Any]):
         self._config = device_config
-        self._lock = asyncio.Lock()
+        self._max_in_flight = device_config.get(
+            CONF_SREQ_IN_FLIGHT, CONF_SREQ_IN_FLIGHT_DEFAULT
+        )
+        # requests of the same command run one at a time, so an SRSP always
+        # belongs to the one pending SREQ of its command; the scheduler keeps
+        # those queued by priority like all other requests
+        self._scheduler = Scheduler(self._max_in_flight)
+        self._latency = LatencyEstimator(
+            device_config.get(CONF_SREQ_TIMEOUT_MIN, CONF_SREQ_TIMEOUT_MIN_DEFAULT),
+            device_config.get(CONF_SREQ_TIMEOUT_MAX),
+        )
+        # waiter for the SRSP of a request that timed out early or was cancelled
+        # after it was sent, handed from _request_raw to _request_queued, which
+        # keeps the command busy until it arrived or the static timeout ran out
+        self._late_responses: Dict[Tuple[Subsystem, str], Waiter] = {}
+        self._shared_requests: Dict[tuple, asyncio.Future] = {}
+        self._cache = ResponseCache()
+        self._credits = DataCredits(device_config.get(CONF_DATA_CREDITS))
+        self._subscriptions = set()
+        # subscriptions with a full queue that want reading from the adapter paused
+        self._paused_by = set()
+        self._reading_paused = False
+        # bumped by flush(), requests queued before that fail once they get a slot
+        self._generation = 0
         self._waiter_id = 0
-        self._waiters: Dict[int, Waiter] = {}
+        self._waiters = WaiterRegistry()
         self._app = None
         self._proto_ver = None
         self._uart = None
+        self._handlers: Dict[Tuple[int, str], List[Callable[[ZpiObject], Any]]] = {}
+        for attr in dir(type(self)):
+            if attr.startswith("_handle_"):
+                command = attr[len("_handle_") :]
+                for subsystem in _command_subsystems(command):
+                    self.add_handler(subsystem, command, getattr(self, attr))
+        self.add_handler(Subsystem.SYS, "resetInd", self._invalidate_cache)
+        self.add_handler(Subsystem.ZDO, "stateChangeInd", self._invalidate_cache)
+        self.add_handler(Subsystem.AF, "dataConfirm", self._data_confirmed)
 
     @property
     def protocol_version(self):
         """Protocol Version."""
         return self._proto_ver
 
+    def add_handler(
+        self, subsystem: Subsystem, command: str, handler: Callable[[ZpiObject], Any]
+    ) -> None:
+        """Call handler with every received frame of the command"""
+        self._handlers.setdefault((int(subsystem), command), []).append(handler)
+
+    def remove_handler(
+        self, subsystem: Subsystem, command: str, handler: Callable[[ZpiObject], Any]
+    ) -> None:
+        key = (int(subsystem), command)
+        handlers = self._handlers.get(key, [])
+        handlers.remove(handler)
+        if not handlers:
+            del self._handlers[key]
+
+    @property
+    def queue_stats(self) -> Dict[Priority, QueueStats]:
+        """Queue depth and wait time of each request priority class"""
+        return self._scheduler.stats
+
+    def subscribe(
+        self,
+        subsystem: Subsystem,
+        command: str,
+        payload: Optional[dict] = None,
+        maxsize: int = 100,
+        overflow: str = DROP_OLDEST,
+    ) -> Subscription:
+        """Async iterator over every received frame of the command whose payload
+        matches the given fields.
+
+        Once maxsize frames are queued, DROP_OLDEST drops the oldest and counts
+        it in the subscription's stats, BLOCK pauses reading from the adapter
+        until the consumer caught up. Pausing stops every response as well, so
+        it only happens while no request waits for the adapter, and a request
+        sent meanwhile resumes reading. A BLOCK queue can then grow beyond
+        maxsize until the requests are answered."""
+
+        def unsubscribe(subscription):
+            self.remove_handler(subsystem, command, subscription.put)
+            self._subscriptions.discard(subscription)
+
+        subscription = Subscription(
+            payload,
+            maxsize,
+            overflow,
+            unsubscribe,
+            self._pause_reading,
+            self._resume_reading,
+        )
+        self.add_handler(subsystem, command, subscription.put)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def _pause_reading(self, subscription: Subscription) -> None:
+        self._paused_by.add(subscription)
+        self._update_reading()
+
+    def _resume_reading(self, subscription: Subscription) -> None:
+        self._paused_by.discard(subscription)
+        self._update_reading()
+
+    def _update_reading(self) -> None:
+        # a paused transport would hold back the responses requests wait for
+        pause = bool(
+            self._paused_by and not self._waiters and not self._credits.outstanding
+        )
+        if pause == self._reading_paused or self._uart is None:
+            return
+        self._reading_paused = pause
+        if pause:
+            LOGGER.debug("Subscriber queue full, pausing reading")
+            self._uart.pause_reading()
+        else:
+            self._uart.resume_reading()
+
+    @property
+    def credit_stats(self) -> CreditStats:
+        return self._credits.stats
+
+    def _data_confirmed(self, obj: ZpiObject) -> None:
+        self._credits.confirmed(obj.payload["transid"])
+
+    @property
+    def cache_stats(self) -> CacheStats:
+        """Hits and misses of the response cache"""
+        return self._cache.stats
+
+    def _invalidate_cache(self, obj: ZpiObject) -> None:
+        self._cache.clear()
+
+    @property
+    def latency_stats(self) -> Dict[Tuple[Subsystem, str], LatencyStats]:
+        """SRSP latency and learned timeout of each command"""
+        return self._latency.stats
+
     @classmethod
     async def new(cls, application, config: Dict[str, Any]) -> "API":
         api = cls(config)
@@ -100,45 +528,227 @@ class API:
 
     async def connect(self):
         assert self._uart is None
+        if self._config[CONF_DEVICE_PATH] == "auto":
+            port = await self.detect_port(self._config)
+            self._config = {**self._config, CONF_DEVICE_PATH: port}
+        if self._config[CONF_DEVICE_BAUDRATE] == CONF_DEVICE_BAUDRATE_AUTO:
+            baudrate = await self.detect_baudrate(self._config)
+            if baudrate is None:
+                raise serial.SerialException(
+                    "No baudrate of {} is answered by '{}'".format(
+                        BAUDRATE_CANDIDATES, self._config[CONF_DEVICE_PATH]
+                    )
+                )
+            self._config = {**self._config, CONF_DEVICE_BAUDRATE: baudrate}
         self._uart = await uart.connect(self._config, self)
 
     def close(self):
+        self.flush(RequestAborted("Connection to the adapter closed"))
+        for subscription in list(self._subscriptions):
+            subscription.close()
         if self._uart:
             self._uart.close()
             self._uart = None
 
     def connection_lost(self):
+        self.flush(RequestAborted("Connection to the adapter lost"))
         self._app.connection_lost()
 
+    def flush(self, error: Exception) -> None:
+        """Fail every pending waiter and every request still queued for the
+        adapter with error"""
+        self._generation += 1
+        self._cache.clear()
+        self._credits.clear()
+        if self._waiters:
+            LOGGER.debug("Aborting %d pending waiters: %s", len(self._waiters), error)
+        for waiter_id in list(self._waiters):
+            self._waiters.pop(waiter_id).abort(error)
+
     async def request(
-        self, subsystem, command, payload, waiter_id=None, expected_status=None
+        self,
+        subsystem,
+        command,
+        payload,
+        waiter_id=None,
+        expected_status=None,
+        priority: Optional[Priority] = None,
     ):
         obj = ZpiObject.from_command(subsystem, command, payload)
-        return await self.request_raw(obj, waiter_id, expected_status)
+        if waiter_id is not None or (obj.subsystem, command) not in IDEMPOTENT_COMMANDS:
+            return await self.request_raw(obj, waiter_id, expected_status, priority)
+
+        key = (
+            int(obj.subsystem),
+            command,
+            obj.to_unpi_frame().data,
+            tuple(expected_status or ()),
+        )
+        ttl = _cache_ttl(obj)
+        if ttl is not None:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached.copy()
+
+        shared = self._shared_requests.get(key)
+        while shared is not None:
+            LOGGER.debug("Sharing in flight request: %s", obj)
+            try:
+                # one caller giving up must not cancel the request for the others
+                return (await asyncio.shield(shared)).copy()
+            except asyncio.CancelledError:
+                if not shared.cancelled():
+                    raise
+            # the caller sending the request was cancelled, send it again
+            shared = self._shared_requests.get(key)
+
+        shared = self._shared_requests[key] = asyncio.get_event_loop().create_future()
+        generation = self._cache.generation
+        try:
+            result = await self.request_raw(obj, None, expected_status, priority)
+        except asyncio.CancelledError:
+            shared.cancel()
+            raise
+        except Exception as exc:
+            shared.set_exception(exc)
+            # retrieved, nobody else may be waiting for it
+            shared.exception()
+            raise
+        else:
+            shared.set_result(result)
+            if ttl is not None:
+                self._cache.put(key, result, ttl, generation)
+            # every caller gets its own copy, the cache keeps the original
+            return result.copy()
+        finally:
+            del self._shared_requests[key]
+
+    async def request_many(
+        self, requests: List[tuple], return_exceptions: bool = False
+    ) -> List[Any]:
+        """Send (subsystem, command, payload[, expected_status]) requests as fast as
+        the in-flight limit allows and return their results in order. Only
+        requests of different commands overlap, those of the same command are
+        still sent one at a time.
+
+        The first failure cancels the other requests and is raised, with
+        return_exceptions failures are returned in place of their result. A
+        cancelled request that was sent already keeps its command busy until
+        its response arrived, so it can't answer a later request."""
+        tasks = [
+            asyncio.ensure_future(
+                self.request(subsystem, command, payload, None, *rest)
+            )
+            for subsystem, command, payload, *rest in requests
+        ]
+        if return_exceptions:
+            return await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def request_raw(
+        self,
+        obj: ZpiObject,
+        waiter_id=None,
+        expected_status=None,
+        priority: Optional[Priority] = None,
+    ):
+        if priority is None:
+            priority = classify(obj)
+        if obj.subsystem != Subsystem.AF or obj.command not in DATA_REQUESTS:
+            return await self._request_queued(obj, waiter_id, expected_status, priority)
 
-    async def request_raw(self, obj: ZpiObject, waiter_id=None, expected_status=None):
-        async with self._lock:
-            return await self._request_raw(obj, waiter_id, expected_status)
+        transid = obj.payload["transid"]
+        await self._credits.acquire(transid)
+        try:
+            return await self._request_queued(
+                obj, waiter_id, expected_status, priority, credit=True
+            )
+        except BaseException:
+            self._credits.cancel(transid)
+            raise
+
+    async def _request_queued(
+        self, obj, waiter_id, expected_status, priority, credit=False
+    ):
+        if obj.is_reset_command():
+            # both reset commands share a key, so only one of them at a time
+            # drains every in flight slot while the adapter resets
+            key = (int(Subsystem.SYS), "resetReq")
+            slots = self._max_in_flight
+        else:
+            key = (int(obj.subsystem), obj.command)
+            slots = 1
 
-    async def _request_raw(self, obj: ZpiObject, waiter_id=None, expected_status=None):
+        generation = self._generation
+        await self._scheduler.acquire(priority, slots, key)
+        try:
+            self._check_generation(obj, generation)
+            if not self._uart.writable:
+                # the transport can't keep up, don't pile up more frames
+                await self._uart.drain()
+                self._check_generation(obj, generation)
+            return await self._request_raw(obj, waiter_id, expected_status, credit)
+        finally:
+            late = self._late_responses.pop((obj.subsystem, obj.command), None)
+            if late is None:
+                self._scheduler.release(slots, key)
+            else:
+                # the SRSP may still come, it must not answer the next request
+                # of the command, which waits for it while others go ahead
+                self._scheduler.release(slots)
+                late.future.add_done_callback(lambda _: self._scheduler.release(0, key))
+
+    def _check_generation(self, obj: ZpiObject, generation: int) -> None:
+        if generation != self._generation or self._uart is None:
+            raise RequestAborted(
+                "Adapter reset or disconnected before '{}' was sent".format(obj.command)
+            )
+
+    async def _request_raw(
+        self, obj: ZpiObject, waiter_id=None, expected_status=None, credit=False
+    ):
         if expected_status is None:
             expected_status = [0]
 
         LOGGER.debug("--> %s", obj)
         frame = obj.to_unpi_frame()
+        if (obj.subsystem, obj.command) in CACHE_INVALIDATING_COMMANDS:
+            self._cache.clear()
 
         if obj.command_type == CommandType.SREQ:
-            timeout = (
-                20000
-                if obj.command == "bdbStartCommissioning"
-                or obj.command == "startupFromApp"
-                else Timeouts.SREQ
-            )
+            key = (obj.subsystem, obj.command)
+            default = SREQ_TIMEOUTS.get(key, Timeouts.SREQ)
+            timeout = self._latency.timeout(key, default)
             waiter = self.wait_for(
                 CommandType.SRSP, obj.subsystem, obj.command, {}, timeout
             )
+            loop = asyncio.get_event_loop()
+            sent = loop.time()
+            if credit:
+                # the dataConfirm may arrive in the same chunk as the SRSP
+                self._credits.sent(obj.payload["transid"])
             self._uart.send(frame)
-            result = await waiter.wait()
+            try:
+                result = await waiter.wait()
+            except asyncio.TimeoutError:
+                self._latency.timed_out(key, default)
+                if timeout < default:
+                    # the SRSP may still arrive within the static timeout
+                    self._wait_late(obj, sent + default / 1000)
+                raise
+            except asyncio.CancelledError:
+                if self._waiters.pop(waiter.id, None) is not None:
+                    # the caller went away, but the SRSP is still coming
+                    self._wait_late(obj, sent + default / 1000)
+                raise
+            self._latency.sample(key, (loop.time() - sent) * 1000, default)
             if (
                 result
                 and "status" in result.payload
@@ -156,10 +766,10 @@ class API:
             else:
                 return result
         elif obj.command_type == CommandType.AREQ and obj.is_reset_command():
+            self.flush(RequestAborted("Adapter reset"))
             waiter = self.wait_for(
                 CommandType.AREQ, Subsystem.SYS, "resetInd", {}, Timeouts.reset
             )
-            # TODO clear queue, requests waiting for lock
             self._uart.send(frame)
             return await waiter.wait()
         else:
@@ -170,6 +780,15 @@ class API:
                 LOGGER.warning("Unknown type '%s'", obj.command_type)
                 raise Exception("Unknown type '{}'".format(obj.command_type))
 
+    def _wait_late(self, obj: ZpiObject, deadline: float) -> None:
+        """Hand the SRSP of a request nobody waits for anymore to a waiter of its
+        own until deadline, _request_queued keeps the command busy until then"""
+        remaining = (deadline - asyncio.get_event_loop().time()) * 1000
+        if remaining > 0:
+            self._late_responses[(obj.subsystem, obj.command)] = self.wait_for(
+                CommandType.SRSP, obj.subsystem, obj.command, {}, remaining
+            )
+
     def create_response_waiter(self, obj: ZpiObject, sequence=None):
         if obj.command_type == CommandType.SREQ and obj.command.startswith(
             "dataRequest"
@@ -181,12 +800,11 @@ class API:
 
         if obj.command_type == CommandType.SREQ and obj.command.endswith("Req"):
             rsp = obj.command.replace("Req", "Rsp")
-            for cmd in Definition[obj.subsystem]:
-                if rsp == cmd["name"]:
-                    payload = {"srcaddr": obj.payload["dstaddr"]}
-                    return self.wait_for(
-                        CommandType.AREQ, Subsystem.ZDO, rsp, payload, sequence=sequence
-                    )
+            if get_command(obj.subsystem, rsp) is not None:
+                payload = {"srcaddr": obj.payload["dstaddr"]}
+                return self.wait_for(
+                    CommandType.AREQ, Subsystem.ZDO, rsp, payload, sequence=sequence
+                )
 
         LOGGER.warning("no response cmd configured for %s", obj.command)
         return None
@@ -209,52 +827,55 @@ class API:
             timeout,
             sequence,
         )
+        waiter.deadline = asyncio.get_event_loop().time() + timeout / 1000
         self._waiters[waiter.id] = waiter
         self._waiter_id += 1
-
-        def callback():
-            if not waiter.future.done() or waiter.future.cancelled():
-                LOGGER.warning(
-                    "No response for: %s %s %s %s",
-                    command_type.name,
-                    subsystem.name,
-                    command,
-                    payload,
-                )
-                try:
-                    self._waiters.pop(waiter.id)
-                except KeyError:
-                    LOGGER.warning("Waiter not found: %s", waiter)
-
-        asyncio.get_event_loop().call_later(timeout / 1000 + 0.1, callback)
+        if self._reading_paused:
+            self._update_reading()
 
         return waiter
 
     def data_received(self, frame):
-        try:
-            obj = ZpiObject.from_unpi_frame(frame)
-        except Exception as e:
-            LOGGER.error("Error while parsing frame: %s", frame)
-            raise e
+        self.frames_received([frame])
 
-        for waiter_id in list(self._waiters):
-            waiter = self._waiters.get(waiter_id)
-            if waiter.match(obj):
-                self._waiters.pop(waiter_id)
-                waiter.set_result(obj)
-                if waiter.sequence:
-                    obj.sequence = waiter.sequence
-                    break
+    def frames_received(self, frames):
+        """Handle every frame decoded from one chunk of serial data, in order,
+        each one by the waiters, the application and the handlers before the
+        next"""
+        debug = LOGGER.isEnabledFor(logging.DEBUG)
+        for frame in frames:
+            try:
+                obj = ZpiObject.from_unpi_frame(frame)
+            except Exception:
+                LOGGER.exception("Error while parsing frame: %s", frame)
+                continue
 
-        LOGGER.debug("<-- %s", obj)
+            if self._waiters:
+                self._resolve_waiters(obj)
 
-        if self._app is not None:
-            self._app.handle_znp(obj)
+            if debug:
+                LOGGER.debug("<-- %s", obj)
 
-        try:
-            getattr(self, "_handle_%s" % (obj.command,))(obj)
-        except AttributeError:
-            pass
+            if self._app is not None:
+                self._app.handle_znp(obj)
+
+            handlers = self._handlers.get((int(obj.subsystem), obj.command))
+            if handlers:
+                for handler in list(handlers):
+                    handler(obj)
+
+        if self._paused_by and not self._reading_paused:
+            # pause again for full subscriptions once the requests are answered
+            self._update_reading()
+
+    def _resolve_waiters(self, obj: ZpiObject) -> None:
+        waiters = self._waiters
+        for waiter in waiters.match(obj):
+            waiters.pop(waiter.id)
+            waiter.set_result(obj)
+            if waiter.sequence:
+                obj.sequence = waiter.sequence
+                break
 
     async def version(self):
         version = await self.request(Subsystem.SYS, "version", {})
@@ -271,10 +892,117 @@ class API:
     def _handle_srcRtgInd(self, data):
         pass
 
+    @classmethod
+    async def detect_port(cls, device_config: Dict[str, Any]) -> str:
+        """Probe every candidate port at once and return the coordinator's."""
+        ieee = device_config.get(CONF_DEVICE_IEEE)
+        ports = [device.device for device in uart.list_ports()]
+        if not ports:
+            raise serial.SerialException("Unable to find TI CC device using auto mode")
+
+        cached = _detected_ports.get(ieee)
+        if cached in ports:
+            # try the port picked last time before disturbing the others
+            if await cls._probe_port({**device_config, CONF_DEVICE_PATH: cached}, ieee):
+                return cached
+            ports.remove(cached)
+
+        tasks = {
+            asyncio.ensure_future(
+                cls._probe_port({**device_config, CONF_DEVICE_PATH: port}, ieee)
+            ): port
+            for port in ports
+        }
+        found = None
+        try:
+            pending = set(tasks)
+            loop = asyncio.get_event_loop()
+            deadline = loop.time() + _detect_timeout(device_config)
+            while pending and found is None:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=max(0, deadline - loop.time()),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    break
+                answered = [tasks[task] for task in done if task.result()]
+                if answered:
+                    found = min(answered)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if found is None:
+            raise serial.SerialException(
+                "None of {} answered as a ZNP coordinator{}".format(
+                    ", ".join(ports), " with IEEE {}".format(ieee) if ieee else ""
+                )
+            )
+
+        if len(ports) > 1 and ieee is None:
+            LOGGER.warning(
+                "Picked '%s' out of %s, configure '%s' to select a coordinator",
+                found,
+                ports,
+                CONF_DEVICE_IEEE,
+            )
+        LOGGER.info("Auto select TI CC device: %s", found)
+        _detected_ports[ieee] = found
+        return found
+
+    @classmethod
+    async def _probe_port(
+        cls, device_config: Dict[str, Any], ieee: Optional[zigpy.types.EUI64] = None
+    ) -> bool:
+        """Check a ZNP coordinator, with the given IEEE if any, answers on the port"""
+        api = cls(device_config)
+        try:
+            return await asyncio.wait_for(
+                api._probe_coordinator(ieee), timeout=_detect_timeout(device_config)
+            )
+        except (
+            asyncio.TimeoutError,
+            serial.SerialException,
+            zigpy.exceptions.ZigbeeException,
+        ) as exc:
+            LOGGER.debug(
+                "Unsuccessful radio probe of '%s' port",
+                device_config[CONF_DEVICE_PATH],
+                exc_info=exc,
+            )
+            return False
+        finally:
+            api.close()
+
+    @classmethod
+    async def detect_baudrate(
+        cls, device_config: Dict[str, Any], baudrates=BAUDRATE_CANDIDATES
+    ) -> Optional[int]:
+        """Return the fastest of the baudrates the device answers on."""
+        if uart.is_socket_url(device_config[CONF_DEVICE_PATH]):
+            # the bridge owns the serial settings, any value will do
+            return min(baudrates)
+
+        for baudrate in sorted(baudrates, reverse=True):
+            if await cls.probe({**device_config, CONF_DEVICE_BAUDRATE: baudrate}):
+                LOGGER.info(
+                    "Detected baudrate %d on '%s'",
+                    baudrate,
+                    device_config[CONF_DEVICE_PATH],
+                )
+                return baudrate
+
+        return None
+
     @classmethod
     async def probe(cls, device_config: Dict[str, Any]) -> bool:
         """Probe port for the device presence."""
-        api = cls(SCHEMA_DEVICE(device_config))
+        device_config = SCHEMA_DEVICE(device_config)
+        if device_config[CONF_DEVICE_BAUDRATE] == CONF_DEVICE_BAUDRATE_AUTO:
+            return await cls.detect_baudrate(device_config) is not None
+
+        api = cls(device_config)
         try:
             await asyncio.wait_for(api._probe(), timeout=COMMAND_TIMEOUT)
             return True
@@ -297,3 +1025,10 @@ class API:
         """Open port and try sending a command"""
         await self.connect()
         await self.version()
+
+    async def _probe_coordinator(self, ieee: Optional[zigpy.types.EUI64]) -> bool:
+        await self._probe()
+        if ieee is None:
+            return True
+        info = await self.request(Subsystem.UTIL, "getDeviceInfo", {})
+        return info.payload["ieeeaddr"] == ieee
@@ -0,0 +1,155 @@
+"""
+Wire capture of serial traffic into a fixed-size memory-mapped ring file.
+
+Sent frames and received chunks of bytes, garbage included, are stored in
+fixed-size slots together with their sequence number, timestamp and direction,
+data longer than a slot spans several. The oldest slots are overwritten once
+the ring is full. Dump a capture with:
+
+    python -m zigpy_cc.capture dump capture.bin
+    python -m zigpy_cc.capture dump capture.bin --pcap capture.pcap
+"""
+import argparse
+import datetime
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Iterator, NamedTuple
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b"ZCCAP\x00\x01\x00"
+HEADER = struct.Struct("<8sIIQ")  # magic, slot size, slot count, next sequence
+SEQUENCE_OFFSET = 16
+RECORD = struct.Struct("<QdBH")  # sequence, timestamp, direction, length
+# SOF, length, cmd0, cmd1, 255 data bytes and FCS
+MAX_FRAME_SIZE = 260
+SLOT_SIZE = RECORD.size + MAX_FRAME_SIZE
+
+RX = 0
+TX = 1
+DIRECTIONS = {RX: "RX", TX: "TX"}
+
+# https://www.tcpdump.org/linktypes.html, first byte of a packet is the direction
+LINKTYPE_USER0 = 147
+PCAP_HEADER = struct.Struct("<IHHiIII")
+PCAP_RECORD = struct.Struct("<IIII")
+
+
+class CaptureRecord(NamedTuple):
+    sequence: int
+    timestamp: float
+    direction: int
+    data: bytes
+
+
+class RingCapture:
+    def __init__(self, path: str, size: int) -> None:
+        self.path = path
+        self._slots = max(1, (size - HEADER.size) // SLOT_SIZE)
+        size = HEADER.size + self._slots * SLOT_SIZE
+
+        self._file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+        header = self._file.read(HEADER.size)
+        if header and not header.startswith(MAGIC):
+            self._file.close()
+            raise ValueError(
+                "Refusing to overwrite {}, not a zigpy-cc capture file".format(path)
+            )
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+
+        self._sequence = 0
+        if len(header) == HEADER.size:
+            magic, slot_size, slots, sequence = HEADER.unpack(header)
+            if (magic, slot_size, slots) == (MAGIC, SLOT_SIZE, self._slots):
+                self._sequence = sequence
+        HEADER.pack_into(self._mmap, 0, MAGIC, SLOT_SIZE, self._slots, self._sequence)
+
+    def write(self, direction: int, data: bytes) -> None:
+        timestamp = time.time()
+        sequence = self._sequence
+        for chunk in range(0, max(1, len(data)), MAX_FRAME_SIZE):
+            part = data[chunk : chunk + MAX_FRAME_SIZE]
+            offset = HEADER.size + (sequence % self._slots) * SLOT_SIZE
+            RECORD.pack_into(
+                self._mmap, offset, sequence, timestamp, direction, len(part)
+            )
+            start = offset + RECORD.size
+            self._mmap[start : start + len(part)] = part
+            sequence += 1
+
+        self._sequence = sequence
+        struct.pack_into("<Q", self._mmap, SEQUENCE_OFFSET, self._sequence)
+
+    def close(self) -> None:
+        self._mmap.flush()
+        self._mmap.close()
+        self._file.close()
+
+
+def read_capture(path: str) -> Iterator[CaptureRecord]:
+    """Yield the records of a capture file, oldest first"""
+    with open(path, "rb") as f:
+        buffer = f.read()
+
+    magic, slot_size, slots, sequence = HEADER.unpack_from(buffer)
+    if magic != MAGIC or slot_size != SLOT_SIZE:
+        raise ValueError("Not a zigpy-cc capture file: {}".format(path))
+
+    for expected in range(max(0, sequence - slots), sequence):
+        offset = HEADER.size + (expected % slots) * SLOT_SIZE
+        seq, timestamp, direction, length = RECORD.unpack_from(buffer, offset)
+        if seq != expected:
+            continue
+        start = offset + RECORD.size
+        yield CaptureRecord(seq, timestamp, direction, buffer[start : start + length])
+
+
+def dump_text(records, out) -> None:
+    for record in records:
+        out.write(
+            "{} {:>8} {} {}\n".format(
+                datetime.datetime.fromtimestamp(record.timestamp).isoformat(),
+                record.sequence,
+                DIRECTIONS.get(record.direction, "??"),
+                " ".join("%02x" % b for b in record.data),
+            )
+        )
+
+
+def dump_pcap(records, out) -> None:
+    out.write(PCAP_HEADER.pack(0xA1B2C3D4, 2, 4, 0, 0, 65535, LINKTYPE_USER0))
+    for record in records:
+        seconds = int(record.timestamp)
+        micros = int((record.timestamp - seconds) * 1000000)
+        packet = bytes([record.direction]) + record.data
+        out.write(PCAP_RECORD.pack(seconds, micros, len(packet), len(packet)))
+        out.write(packet)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m zigpy_cc.capture")
+    commands = parser.add_subparsers(dest="command")
+    dump = commands.add_parser("dump", help="dump a capture ring file")
+    dump.add_argument("capture")
+    dump.add_argument("--pcap", help="write a pcap file instead of text")
+    args = parser.parse_args(argv)
+    if args.command != "dump":
+        parser.print_usage()
+        return 2
+
+    records = read_capture(args.capture)
+    if args.pcap:
+        with open(args.pcap, "wb") as out:
+            dump_pcap(records, out)
+    else:
+        dump_text(records, sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+Payload codecs compiled per command parameter list.
+
+The leading fixed-size parameters of a command are packed and unpacked with a
+single struct.Struct, the remaining buffer and list parameters go through
+Buffalo like before. Data that doesn't fit the struct falls back to Buffalo for
+the whole payload, so errors stay the same.
+
+Received frames get a LazyPayload, which unpacks a prefix field only when it is
+read.
+"""
+import enum
+import struct
+from collections.abc import Iterable, Mapping
+from typing import Dict, List, Optional
+
+import zigpy.types
+
+from zigpy_cc.buffalo import Buffalo, BuffaloOptions
+from zigpy_cc.definition import Definition
+from zigpy_cc.types import AddressMode, ParameterType
+
+BufferAndListTypes = [
+    ParameterType.BUFFER,
+    ParameterType.BUFFER8,
+    ParameterType.BUFFER16,
+    ParameterType.BUFFER18,
+    ParameterType.BUFFER32,
+    ParameterType.BUFFER42,
+    ParameterType.BUFFER100,
+    ParameterType.LIST_UINT16,
+    ParameterType.LIST_ROUTING_TABLE,
+    ParameterType.LIST_BIND_TABLE,
+    ParameterType.LIST_NEIGHBOR_LQI,
+    ParameterType.LIST_NETWORK,
+    ParameterType.LIST_ASSOC_DEV,
+    ParameterType.LIST_UINT8,
+]
+
+# struct formats of the fixed-size types Buffalo reads
+READ_FORMATS = {
+    ParameterType.UINT8: "B",
+    ParameterType.UINT16: "H",
+    ParameterType.UINT32: "I",
+    ParameterType.IEEEADDR: "8s",
+    ParameterType.BUFFER8: "8s",
+    ParameterType.BUFFER16: "16s",
+    ParameterType.BUFFER18: "18s",
+    ParameterType.BUFFER32: "32s",
+    ParameterType.BUFFER42: "42s",
+    ParameterType.BUFFER100: "100s",
+    ParameterType.INT8: "b",
+}
+# and of those Buffalo writes
+WRITE_FORMATS = {
+    ParameterType.UINT8: "B",
+    ParameterType.UINT16: "H",
+    ParameterType.UINT32: "I",
+    ParameterType.IEEEADDR: "8s",
+}
+
+
+def _is_nwk(name: str) -> bool:
+    return (
+        name.endswith("addr")
+        or name.endswith("address")
+        or name.endswith("addrofinterest")
+    )
+
+
+def _read_converter(name: str, param_type):
+    """The conversion Buffalo.read_parameter applies on top of the raw value"""
+    if param_type == ParameterType.UINT8 and name.endswith("addrmode"):
+        return AddressMode
+    if param_type == ParameterType.UINT16 and _is_nwk(name):
+        return zigpy.types.NWK
+    if param_type == ParameterType.IEEEADDR:
+        return zigpy.types.EUI64
+    return None
+
+
+def _ieee_bytes(value) -> bytes:
+    if isinstance(value, Iterable):
+        return bytes(value)
+    return value.to_bytes(8, "little")
+
+
+def _prefix(parameters, formats):
+    count = 0
+    fmt = "<"
+    for p in parameters:
+        f = formats.get(p["parameterType"])
+        if f is None:
+            break
+        fmt += f
+        count += 1
+    return count, struct.Struct(fmt)
+
+
+class Codec:
+    def __init__(self, parameters: List[dict]) -> None:
+        self.parameters = parameters
+        self._names = [p["name"] for p in parameters]
+
+        self._read_count, self._read_struct = _prefix(parameters, READ_FORMATS)
+        self._read_converters = [
+            (i, _read_converter(p["name"], p["parameterType"]))
+            for i, p in enumerate(parameters[: self._read_count])
+            if _read_converter(p["name"], p["parameterType"]) is not None
+        ]
+
+        # struct, offset and conversion of every field of the fixed prefix
+        self._fields = {}
+        offset = 0
+        for p in parameters[: self._read_count]:
+            field = struct.Struct("<" + READ_FORMATS[p["parameterType"]])
+            converter = _read_converter(p["name"], p["parameterType"])
+            self._fields[p["name"]] = (field, offset, converter)
+            offset += field.size
+        # enum fields of the prefix, their conversion rejects unknown values
+        self._checked_fields = [
+            name
+            for name, (_, _, converter) in self._fields.items()
+            if isinstance(converter, type) and issubclass(converter, enum.Enum)
+        ]
+
+        self._write_count, self._write_struct = _prefix(parameters, WRITE_FORMATS)
+        self._write_ieee = [
+            i
+            for i, p in enumerate(parameters[: self._write_count])
+            if p["parameterType"] == ParameterType.IEEEADDR
+        ]
+
+    def decode(self, data: bytes) -> dict:
+        count = self._read_count
+        if len(data) < self._read_struct.size:
+            return self._read(Buffalo(data), 0, {}, None, None)
+
+        values = list(self._read_struct.unpack_from(data))
+        for i, converter in self._read_converters:
+            values[i] = converter(values[i])
+        res = dict(zip(self._names, values))
+        if count == len(self.parameters):
+            return res
+
+        length = values[-1] if count else None
+        start_index = values[-2] if count > 1 else None
+        buffalo = Buffalo(data, self._read_struct.size)
+        return self._read(buffalo, count, res, length, start_index)
+
+    def decode_lazy(self, data: bytes) -> Mapping:
+        """Payload decoding each fixed prefix field on first access.
+
+        Enum fields of the prefix and the fields after it are decoded right
+        away, so malformed frames still fail here rather than wherever a field
+        is read."""
+        count = self._read_count
+        if len(data) < self._read_struct.size:
+            # too short, raises like decode always did
+            return self.decode(data)
+
+        values = {}
+        for name in self._checked_fields:
+            field, offset, converter = self._fields[name]
+            values[name] = converter(field.unpack_from(data, offset)[0])
+
+        if count < len(self.parameters):
+            length = start_index = None
+            if count:
+                field, offset, _ = self._fields[self._names[count - 1]]
+                length = field.unpack_from(data, offset)[0]
+            if count > 1:
+                field, offset, _ = self._fields[self._names[count - 2]]
+                start_index = field.unpack_from(data, offset)[0]
+            buffalo = Buffalo(data, self._read_struct.size)
+            self._read(buffalo, count, values, length, start_index)
+        return LazyPayload(self, data, values)
+
+    def _read(self, buffalo, first, res, length, start_index) -> dict:
+        for p in self.parameters[first:]:
+            options = BuffaloOptions()
+            name = p["name"]
+            param_type = p["parameterType"]
+            if param_type in BufferAndListTypes:
+                if isinstance(length, int):
+                    options.length = length
+
+                if param_type == ParameterType.LIST_ASSOC_DEV:
+                    if isinstance(start_index, int):
+                        options.startIndex = start_index
+
+            res[name] = buffalo.read_parameter(name, param_type, options)
+
+            # For LIST_ASSOC_DEV, we need to grab the start_index which is
+            # right before the length
+            start_index = length
+            # When reading a buffer, assume that the previous parsed parameter
+            # contains the length of the buffer
+            length = res[name]
+
+        return res
+
+    def encode(self, payload: dict) -> bytes:
+        names = self._names
+        count = self._write_count
+        values = [payload[name] for name in names[:count]]
+        try:
+            for i in self._write_ieee:
+                values[i] = _ieee_bytes(values[i])
+            data = self._write_struct.pack(*values)
+        except (struct.error, AttributeError, TypeError):
+            # let Buffalo raise what it always did
+            return self._write(Buffalo(b""), 0, payload)
+        if count == len(names):
+            return data
+        return self._write(Buffalo(data), count, payload)
+
+    def _write(self, buffalo, first, payload) -> bytes:
+        for p in self.parameters[first:]:
+            buffalo.write_parameter(p["parameterType"], payload[p["name"]], {})
+        return buffalo.buffer
+
+
+class LazyPayload(Mapping):
+    """Read-only payload mapping of a received frame"""
+
+    __slots__ = ("_codec", "_data", "_values")
+
+    def __init__(self, codec: Codec, data: bytes, values: Optional[dict]) -> None:
+        self._codec = codec
+        self._data = data
+        self._values = values if values is not None else {}
+
+    def __getitem__(self, name: str):
+        values = self._values
+        if name in values:
+            return values[name]
+        field, offset, converter = self._codec._fields[name]
+        value = field.unpack_from(self._data, offset)[0]
+        if converter is not None:
+            value = converter(value)
+        values[name] = value
+        return value
+
+    def __contains__(self, name) -> bool:
+        return name in self._codec._fields or name in self._values
+
+    def __iter__(self):
+        return iter(self._codec._names)
+
+    def __len__(self) -> int:
+        return len(self._codec._names)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+_codecs: Dict[int, Codec] = {}
+
+
+def _compile_definition() -> None:
+    for commands in Definition.values():
+        for cmd in commands:
+            for key in ("request", "response"):
+                if key in cmd:
+                    _codecs[id(cmd[key])] = Codec(cmd[key])
+
+
+def get_codec(parameters: List[dict]) -> Codec:
+    """Compiled codec of a Definition parameter list, other lists get compiled
+    on every call"""
+    codec = _codecs.get(id(parameters))
+    if codec is None or codec.parameters is not parameters:
+        return Codec(parameters)
+    return codec
+
+
+_compile_definition()
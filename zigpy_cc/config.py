@@ -1,4 +1,7 @@
+import urllib.parse
+
 import voluptuous as vol
+import zigpy.types
 from zigpy.config import (  # noqa: F401 pylint: disable=unused-import
     CONF_DATABASE,
     CONF_DEVICE,
@@ -9,16 +12,72 @@ from zigpy.config import (  # noqa: F401 pylint: disable=unused-import
 
 CONF_DEVICE_BAUDRATE = "baudrate"
 CONF_DEVICE_BAUDRATE_DEFAULT = 115200
+CONF_DEVICE_BAUDRATE_AUTO = "auto"
+# tried fastest first when the baudrate is set to auto
+BAUDRATE_CANDIDATES = (921600, 460800, 230400, 115200)
 CONF_FLOW_CONTROL = "flow_control"
 CONF_FLOW_CONTROL_DEFAULT = None
+CONF_SERIAL_THREAD = "serial_thread"
+CONF_CAPTURE_PATH = "capture_path"
+CONF_CAPTURE_SIZE = "capture_size"
+CONF_CAPTURE_SIZE_DEFAULT = 4 * 1024 * 1024
+CONF_DEVICE_IEEE = "ieee"
+# SREQs of different commands allowed to wait for their SRSP at the same time
+CONF_SREQ_IN_FLIGHT = "sreq_in_flight"
+CONF_SREQ_IN_FLIGHT_DEFAULT = 1
+# bounds of the SREQ timeouts learned from SRSP latency, in milliseconds
+CONF_SREQ_TIMEOUT_MIN = "sreq_timeout_min"
+CONF_SREQ_TIMEOUT_MIN_DEFAULT = 500
+CONF_SREQ_TIMEOUT_MAX = "sreq_timeout_max"
+# AF data requests awaiting their dataConfirm at the same time, None for no limit
+CONF_DATA_CREDITS = "data_credits"
+
+SOCKET_SCHEMES = ("socket", "tcp")
+
+
+def cv_socket_url(value: str) -> str:
+    """Validate a socket://host:port or tcp://host:port device path."""
+    try:
+        parsed = urllib.parse.urlparse(value)
+        port = parsed.port
+    except (TypeError, AttributeError, ValueError) as exc:
+        raise vol.Invalid("Invalid socket url: {}".format(value)) from exc
+    if parsed.scheme not in SOCKET_SCHEMES or not parsed.hostname or not port:
+        raise vol.Invalid("Expected socket://host:port, got: {}".format(value))
+    return value
+
 
 SCHEMA_DEVICE = vol.Schema(
     {
-        vol.Required(CONF_DEVICE_PATH): vol.Any(vol.PathExists(), "auto"),
-        vol.Optional(CONF_DEVICE_BAUDRATE, default=CONF_DEVICE_BAUDRATE_DEFAULT): int,
+        vol.Required(CONF_DEVICE_PATH): vol.Any(
+            vol.PathExists(), cv_socket_url, "auto"
+        ),
+        vol.Optional(
+            CONF_DEVICE_BAUDRATE, default=CONF_DEVICE_BAUDRATE_DEFAULT
+        ): vol.Any(int, CONF_DEVICE_BAUDRATE_AUTO),
         vol.Optional(CONF_FLOW_CONTROL, default=CONF_FLOW_CONTROL_DEFAULT): vol.In(
             ("hardware", "software", None)
         ),
+        vol.Optional(CONF_DEVICE_IEEE, default=None): vol.Any(
+            None, zigpy.types.EUI64, zigpy.types.EUI64.convert
+        ),
+        vol.Optional(CONF_SERIAL_THREAD, default=False): cv_boolean,
+        vol.Optional(CONF_CAPTURE_PATH, default=None): vol.Any(None, str),
+        vol.Optional(CONF_CAPTURE_SIZE, default=CONF_CAPTURE_SIZE_DEFAULT): vol.All(
+            int, vol.Range(min=64 * 1024)
+        ),
+        vol.Optional(CONF_SREQ_IN_FLIGHT, default=CONF_SREQ_IN_FLIGHT_DEFAULT): vol.All(
+            int, vol.Range(min=1, max=64)
+        ),
+        vol.Optional(
+            CONF_SREQ_TIMEOUT_MIN, default=CONF_SREQ_TIMEOUT_MIN_DEFAULT
+        ): vol.All(vol.Coerce(int), vol.Range(min=50, max=60000)),
+        vol.Optional(CONF_SREQ_TIMEOUT_MAX, default=None): vol.Any(
+            None, vol.All(vol.Coerce(int), vol.Range(min=50, max=60000))
+        ),
+        vol.Optional(CONF_DATA_CREDITS, default=None): vol.Any(
+            None, vol.All(vol.Coerce(int), vol.Range(min=1, max=255))
+        ),
     }
 )
 
@@ -0,0 +1,124 @@
+"""
+Credits for AF data requests, one per transmission the adapter still has to
+confirm with a dataConfirm.
+
+Z-Stack buffers a limited number of APS transmissions and answers further data
+requests with a buffer full status, so new transmissions wait for a credit
+instead of being sent and failing.
+"""
+import asyncio
+import collections
+import logging
+from typing import Counter, Deque, Dict, Optional
+
+from zigpy_cc.types import Repr
+
+LOGGER = logging.getLogger(__name__)
+
+# seconds after which a transmission without dataConfirm no longer holds a credit
+DATA_CONFIRM_TIMEOUT = 10
+
+
+class CreditStats(Repr):
+    def __init__(self) -> None:
+        self.sent = 0
+        self.confirmed = 0
+        self.expired = 0
+        # acquisitions that had to wait for a credit
+        self.waits = 0
+        self.max_outstanding = 0
+
+
+class DataCredits:
+    def __init__(
+        self, capacity: Optional[int] = None, timeout: float = DATA_CONFIRM_TIMEOUT
+    ) -> None:
+        """capacity of None doesn't limit the transmissions"""
+        self.capacity = capacity
+        self.timeout = timeout
+        # deadline by transid, in the order the transmissions were sent
+        self._outstanding: Dict[int, float] = {}
+        # credits taken by requests that are not sent yet, by transid
+        self._reserved: Counter[int] = collections.Counter()
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+        self.stats = CreditStats()
+
+    @property
+    def outstanding(self) -> int:
+        return len(self._outstanding) + sum(self._reserved.values())
+
+    def _available(self) -> bool:
+        return self.capacity is None or self.outstanding < self.capacity
+
+    def _expire(self, now: float) -> None:
+        for transid, deadline in list(self._outstanding.items()):
+            if deadline > now:
+                break
+            LOGGER.debug("No dataConfirm for transid %s, releasing its credit", transid)
+            del self._outstanding[transid]
+            self.stats.expired += 1
+
+    async def acquire(self, transid: int) -> None:
+        """Reserve a credit for transid, to be passed on with sent() or given
+        back with cancel()"""
+        loop = asyncio.get_event_loop()
+        if self._waiters or not self._available():
+            self.stats.waits += 1
+            future = loop.create_future()
+            self._waiters.append(future)
+            try:
+                while True:
+                    self._expire(loop.time())
+                    if self._waiters[0] is future and self._available():
+                        break
+                    timeout = None
+                    if self._outstanding:
+                        deadline = next(iter(self._outstanding.values()))
+                        timeout = max(0, deadline - loop.time())
+                    await asyncio.wait([future], timeout=timeout)
+                    if future.done():
+                        future = loop.create_future()
+                        self._waiters[0] = future
+            finally:
+                self._waiters.remove(future)
+                self._wake()
+        self._reserved[transid] += 1
+        self.stats.max_outstanding = max(self.stats.max_outstanding, self.outstanding)
+
+    def _unreserve(self, transid: int) -> None:
+        self._reserved[transid] -= 1
+        if not self._reserved[transid]:
+            del self._reserved[transid]
+
+    def sent(self, transid: int) -> None:
+        """The reserved credit is held until the dataConfirm of transid, call
+        it before the request goes out so its dataConfirm can't come first"""
+        self._unreserve(transid)
+        self._outstanding.pop(transid, None)
+        self._outstanding[transid] = asyncio.get_event_loop().time() + self.timeout
+        self.stats.sent += 1
+
+    def cancel(self, transid: int) -> None:
+        """Give back the credit of a failed request, whether it was sent or
+        not"""
+        if self._reserved[transid]:
+            self._unreserve(transid)
+        else:
+            self._outstanding.pop(transid, None)
+        self._wake()
+
+    def confirmed(self, transid: int) -> None:
+        if self._outstanding.pop(transid, None) is not None:
+            self.stats.confirmed += 1
+            self._wake()
+
+    def clear(self) -> None:
+        """The adapter dropped every transmission, release all their credits"""
+        self._outstanding.clear()
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._waiters and self._available():
+            future = self._waiters[0]
+            if not future.done():
+                future.set_result(None)
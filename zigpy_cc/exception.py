@@ -1,6 +1,6 @@
 import logging
 
-from zigpy.exceptions import ZigbeeException
+from zigpy.exceptions import DeliveryError, ZigbeeException
 
 LOGGER = logging.getLogger(__name__)
 
@@ -19,3 +19,7 @@ class CommandError(ZigbeeException):
     @property
     def status(self):
         return self._status
+
+
+class RequestAborted(DeliveryError):
+    """Pending request dropped because the adapter reset or disconnected"""
@@ -0,0 +1,73 @@
+"""
+SREQ timeouts learned from the observed SRSP latency of each command.
+
+Follows the TCP retransmission timer of RFC 6298: a smoothed round trip time
+and its variance give RTO = SRTT + 4 * RTTVAR, clamped between a floor and the
+command's static timeout, and doubled after every timeout.
+"""
+import logging
+from typing import Dict, Hashable, Optional
+
+from zigpy_cc.types import Repr
+
+LOGGER = logging.getLogger(__name__)
+
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+# samples needed before the learned timeout replaces the static one
+MIN_SAMPLES = 3
+
+
+class LatencyStats(Repr):
+    def __init__(self) -> None:
+        self.samples = 0
+        self.timeouts = 0
+        # milliseconds
+        self.srtt: Optional[float] = None
+        self.rttvar: Optional[float] = None
+        self.rto: Optional[float] = None
+
+
+class LatencyEstimator:
+    def __init__(self, floor: float, ceiling: Optional[float] = None) -> None:
+        """floor and ceiling in milliseconds, a ceiling of None leaves the
+        static timeout of each command as upper bound"""
+        self.floor = floor
+        self.ceiling = ceiling
+        self.stats: Dict[Hashable, LatencyStats] = {}
+
+    def _clamp(self, rto: float, default: float) -> float:
+        ceiling = default if self.ceiling is None else min(self.ceiling, default)
+        return max(self.floor, min(rto, ceiling))
+
+    def timeout(self, key: Hashable, default: float) -> float:
+        """Timeout in milliseconds for the next request of key"""
+        stats = self.stats.get(key)
+        if stats is None or stats.rto is None or stats.samples < MIN_SAMPLES:
+            return default
+        return self._clamp(stats.rto, default)
+
+    def sample(self, key: Hashable, latency: float, default: float) -> None:
+        """Record the latency of an answered request, in milliseconds"""
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = LatencyStats()
+        if stats.srtt is None:
+            stats.srtt = latency
+            stats.rttvar = latency / 2
+        else:
+            stats.rttvar = (1 - BETA) * stats.rttvar + BETA * abs(stats.srtt - latency)
+            stats.srtt = (1 - ALPHA) * stats.srtt + ALPHA * latency
+        stats.samples += 1
+        stats.rto = self._clamp(stats.srtt + K * stats.rttvar, default)
+
+    def timed_out(self, key: Hashable, default: float) -> None:
+        """Back off after a request of key got no answer in time"""
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = LatencyStats()
+        stats.timeouts += 1
+        if stats.rto is not None:
+            stats.rto = self._clamp(stats.rto * 2, default)
+            LOGGER.debug("Backing off %s timeout to %.0f ms", key, stats.rto)
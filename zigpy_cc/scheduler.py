@@ -0,0 +1,157 @@
+"""
+Priority scheduling of the request slots towards the adapter.
+
+Requests wait in a single heap ordered by the time they were queued plus the
+aging delay of their class, so a control request overtakes bulk traffic queued
+less than BULK_AGING seconds before it, while bulk requests that waited longer
+are served first and cannot starve.
+
+Requests with the same key, those of one command, are granted one at a time and
+keep their order among each other by the same rank.
+"""
+import asyncio
+import enum
+import heapq
+import itertools
+import logging
+from typing import Dict, Hashable, List, Optional, Set
+
+from zigpy_cc.types import Repr, Subsystem
+from zigpy_cc.zpi_object import ZpiObject
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Priority(enum.IntEnum):
+    CONTROL = 0
+    INTERACTIVE = 1
+    BULK = 2
+
+
+# seconds a request of each class is ranked behind a control request queued at
+# the same time
+AGING = {Priority.CONTROL: 0.0, Priority.INTERACTIVE: 0.5, Priority.BULK: 5.0}
+
+CONTROL_COMMANDS = {
+    (Subsystem.SYS, "ping"),
+    (Subsystem.SYS, "version"),
+    (Subsystem.SYS, "resetReq"),
+    (Subsystem.SAPI, "systemReset"),
+    (Subsystem.ZDO, "mgmtPermitJoinReq"),
+    (Subsystem.UTIL, "ledControl"),
+}
+BULK_COMMANDS = {
+    (Subsystem.ZDO, "mgmtLqiReq"),
+    (Subsystem.ZDO, "mgmtRtgReq"),
+    (Subsystem.ZDO, "mgmtBindReq"),
+}
+DATA_REQUESTS = {"dataRequest", "dataRequestExt", "dataRequestSrcRtg"}
+OTA_CLUSTER = 0x0019
+
+
+def classify(obj: ZpiObject) -> Priority:
+    key = (obj.subsystem, obj.command)
+    if key in CONTROL_COMMANDS:
+        return Priority.CONTROL
+    if key in BULK_COMMANDS:
+        return Priority.BULK
+    if (
+        obj.subsystem == Subsystem.AF
+        and obj.command in DATA_REQUESTS
+        and obj.payload.get("clusterid") == OTA_CLUSTER
+    ):
+        return Priority.BULK
+    return Priority.INTERACTIVE
+
+
+class QueueStats(Repr):
+    def __init__(self) -> None:
+        self.depth = 0
+        self.max_depth = 0
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class Scheduler:
+    def __init__(self, slots: int) -> None:
+        self._free = slots
+        # [rank, sequence, future, priority, slots, queued at, key]
+        self._queue: List[list] = []
+        # keys granted and not released yet
+        self._busy: Set[Hashable] = set()
+        self._sequence = itertools.count()
+        self.stats: Dict[Priority, QueueStats] = {p: QueueStats() for p in Priority}
+
+    async def acquire(
+        self, priority: Priority, slots: int = 1, key: Optional[Hashable] = None
+    ) -> None:
+        stats = self.stats[priority]
+        if not self._queue and self._free >= slots and key not in self._busy:
+            self._free -= slots
+            if key is not None:
+                self._busy.add(key)
+            stats.granted += 1
+            return
+
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        future = loop.create_future()
+        entry = [
+            now + AGING[priority],
+            next(self._sequence),
+            future,
+            priority,
+            slots,
+            now,
+            key,
+        ]
+        heapq.heappush(self._queue, entry)
+        stats.depth += 1
+        stats.max_depth = max(stats.max_depth, stats.depth)
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # granted, but the caller went away before it could use it
+                self.release(slots, key)
+            raise
+        finally:
+            stats.depth -= 1
+
+    def release(self, slots: int = 1, key: Optional[Hashable] = None) -> None:
+        """Return slots and, when given, the key; slots of 0 only return the key"""
+        self._free += slots
+        if key is not None:
+            self._busy.discard(key)
+        self._wake()
+
+    def _wake(self) -> None:
+        queue = self._queue
+        # entries whose key is busy, they don't hold back the ones behind them
+        blocked = []
+        now = None
+        while queue:
+            _, _, future, priority, slots, queued, key = queue[0]
+            if future.cancelled():
+                heapq.heappop(queue)
+                continue
+            if key is not None and key in self._busy:
+                blocked.append(heapq.heappop(queue))
+                continue
+            if self._free < slots:
+                break
+            heapq.heappop(queue)
+            self._free -= slots
+            if key is not None:
+                self._busy.add(key)
+            if now is None:
+                now = asyncio.get_event_loop().time()
+            stats = self.stats[priority]
+            stats.granted += 1
+            stats.total_wait += now - queued
+            stats.max_wait = max(stats.max_wait, now - queued)
+            future.set_result(None)
+        for entry in blocked:
+            heapq.heappush(queue, entry)
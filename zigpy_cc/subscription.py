@@ -0,0 +1,116 @@
+"""
+Continuous streams of received frames, consumed with async for.
+
+    with api.subscribe(Subsystem.ZDO, "srcRtgInd") as indications:
+        async for obj in indications:
+            ...
+"""
+import asyncio
+import collections
+import logging
+from typing import Callable, Optional
+
+from zigpy_cc.types import Repr
+from zigpy_cc.zpi_object import ZpiObject
+
+LOGGER = logging.getLogger(__name__)
+
+# overflow policies of a full subscription queue
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+
+
+class SubscriptionStats(Repr):
+    def __init__(self) -> None:
+        self.received = 0
+        # frames dropped from a full queue
+        self.dropped = 0
+        self.max_depth = 0
+
+
+class Subscription:
+    def __init__(
+        self,
+        payload: Optional[dict],
+        maxsize: int,
+        overflow: str,
+        unsubscribe: Callable[["Subscription"], None],
+        pause: Callable[["Subscription"], None],
+        resume: Callable[["Subscription"], None],
+    ) -> None:
+        if overflow not in (DROP_OLDEST, BLOCK):
+            raise ValueError("Unknown overflow policy: {}".format(overflow))
+        self._payload = payload
+        self._maxsize = maxsize
+        self._overflow = overflow
+        self._unsubscribe = unsubscribe
+        self._pause = pause
+        self._resume = resume
+        self._queue = collections.deque()
+        self._getter: Optional[asyncio.Future] = None
+        self._paused = False
+        self._closed = False
+        self.stats = SubscriptionStats()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def put(self, obj: ZpiObject) -> None:
+        if self._closed:
+            return
+        if self._payload:
+            for field, value in self._payload.items():
+                if obj.payload.get(field) != value:
+                    return
+
+        queue = self._queue
+        self.stats.received += 1
+        if len(queue) >= self._maxsize:
+            if self._overflow == DROP_OLDEST:
+                queue.popleft()
+                self.stats.dropped += 1
+            elif not self._paused:
+                # frames of the chunk being parsed still get queued
+                self._paused = True
+                self._pause(self)
+        queue.append(obj)
+        self.stats.max_depth = max(self.stats.max_depth, len(queue))
+        if self._getter is not None and not self._getter.done():
+            self._getter.set_result(None)
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> ZpiObject:
+        while not self._queue:
+            if self._closed:
+                raise StopAsyncIteration
+            self._getter = asyncio.get_event_loop().create_future()
+            try:
+                await self._getter
+            finally:
+                self._getter = None
+
+        obj = self._queue.popleft()
+        if self._paused and len(self._queue) <= self._maxsize // 2:
+            self._paused = False
+            self._resume(self)
+        return obj
+
+    def close(self) -> None:
+        """Stop receiving, iteration ends once the queued frames are consumed"""
+        if self._closed:
+            return
+        self._closed = True
+        self._unsubscribe(self)
+        if self._paused:
+            self._paused = False
+            self._resume(self)
+        if self._getter is not None and not self._getter.done():
+            self._getter.set_result(None)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
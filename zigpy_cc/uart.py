@@ -1,13 +1,28 @@
 import asyncio
+import collections
+import functools
 import logging
-from typing import Any, Dict
+import queue
+import socket
+import threading
+from typing import Any, Dict, List
+import urllib.parse
 
 import serial
 import serial.tools.list_ports
 import serial_asyncio
 from serial.tools.list_ports_common import ListPortInfo
 
-from zigpy_cc.config import CONF_DEVICE_BAUDRATE, CONF_DEVICE_PATH, CONF_FLOW_CONTROL
+from zigpy_cc import capture
+from zigpy_cc.config import (
+    CONF_CAPTURE_PATH,
+    CONF_CAPTURE_SIZE,
+    CONF_DEVICE_BAUDRATE,
+    CONF_DEVICE_PATH,
+    CONF_FLOW_CONTROL,
+    CONF_SERIAL_THREAD,
+    SOCKET_SCHEMES,
+)
 import zigpy_cc.types as t
 
 LOGGER = logging.getLogger(__name__)
@@ -22,6 +37,20 @@ PositionCmd1 = 3
 MinMessageLength = 5
 MaxDataSize = 250
 
+# seconds of silence after which a partial frame is dropped, its length byte
+# may have been corrupted; serial thread mode uses SERIAL_READ_TIMEOUT instead
+PARTIAL_FRAME_TIMEOUT = 0.5
+# how long the serial bootloader may take to hand over to the ZNP, in seconds
+BOOTLOADER_TIMEOUT = 1
+HANDSHAKE_INTERVAL = 0.1
+
+# serial thread mode: blocking read timeout in seconds and the queued bytes
+# above which the protocol is asked to pause writing
+SERIAL_READ_TIMEOUT = 0.5
+WRITE_HIGH_WATER = 64 * 1024
+# bytes queued by Gateway.send above which requests wait for the queue to drain
+SEND_HIGH_WATER = 16 * 1024
+
 """
 0451:     Texas Instruments
 1a86:7523 QinHeng Electronics HL-340 USB-Serial adapter
@@ -30,31 +59,109 @@ MaxDataSize = 250
 usb_regexp = "0451:|1a86:7523"
 
 
-class Parser:
+class ParserStats(t.Repr):
     def __init__(self) -> None:
-        self.buffer = b""
+        self.bytes_dropped = 0
+        self.bad_checksums = 0
+        self.oversize_lengths = 0
+        self.unknown_types = 0
+        self.resyncs = 0
+
 
-    def write(self, b: int):
-        self.buffer += bytes([b])
-        if SOF == self.buffer[0]:
-            if len(self.buffer) > MinMessageLength:
-                dataLength = self.buffer[PositionDataLength]
+class Parser:
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.stats = ParserStats()
+        self._in_sync = True
+
+    def _lost_sync(self):
+        if self._in_sync:
+            self._in_sync = False
+            self.stats.resyncs += 1
+
+    def write(self, data: bytes) -> List["UnpiFrame"]:
+        """Consume a chunk of received bytes and return every complete frame
+
+        Garbage, frames with an invalid length and frames failing the checksum
+        are skipped by rescanning from the byte after their SOF, so a corrupted
+        frame never takes the frames following it down with it.
+        """
+        buffer = self.buffer
+        buffer += data
+        end = len(buffer)
+        stats = self.stats
+        frames = []
+
+        position = 0
+        with memoryview(buffer) as view:
+            while True:
+                start = buffer.find(SOF, position)
+                if start < 0:
+                    start = end
+                if start != position:
+                    LOGGER.debug("drop %d chars", start - position)
+                    self._lost_sync()
+                    stats.bytes_dropped += start - position
+                    position = start
+                if position == end or end - position < MinMessageLength:
+                    break
+
+                dataLength = buffer[position + PositionDataLength]
+                if dataLength > MaxDataSize:
+                    LOGGER.debug("Invalid frame length: %d", dataLength)
+                    self._lost_sync()
+                    stats.oversize_lengths += 1
+                    stats.bytes_dropped += 1
+                    position += 1
+                    continue
 
                 fcsPosition = DataStart + dataLength
                 frameLength = fcsPosition + 1
 
-                if len(self.buffer) >= frameLength:
-                    frameBuffer = self.buffer[0:frameLength]
-                    self.buffer = self.buffer[frameLength:]
-
-                    frame = UnpiFrame.from_buffer(dataLength, fcsPosition, frameBuffer)
-
-                    return frame
-        else:
-            LOGGER.debug("drop char")
-            self.buffer = b""
-
-        return None
+                if end - position < frameLength:
+                    break
+
+                try:
+                    frame = UnpiFrame.from_buffer(
+                        dataLength, fcsPosition, view[position : position + frameLength]
+                    )
+                except ValueError:
+                    # checksum is fine, but the type or subsystem is not one we
+                    # know, skip the whole frame
+                    LOGGER.warning(
+                        "Unknown frame type: %s",
+                        bytes(view[position : position + frameLength]),
+                    )
+                    stats.unknown_types += 1
+                    stats.bytes_dropped += frameLength
+                    position += frameLength
+                    continue
+                if frame is None:
+                    self._lost_sync()
+                    stats.bad_checksums += 1
+                    stats.bytes_dropped += 1
+                    position += 1
+                    continue
+
+                self._in_sync = True
+                frames.append(frame)
+                position += frameLength
+
+        if position:
+            del buffer[:position]
+
+        return frames
+
+    def skip_partial(self) -> List["UnpiFrame"]:
+        """Drop the SOF of the partial frame the line went quiet on, in case its
+        length byte was corrupted, and return the frames following it"""
+        if not self.buffer:
+            return []
+        LOGGER.debug("Dropping partial frame: %s", bytes(self.buffer))
+        self._lost_sync()
+        self.stats.bytes_dropped += 1
+        del self.buffer[0]
+        return self.write(b"")
 
 
 class UnpiFrame(t.Repr):
@@ -79,14 +186,16 @@ class UnpiFrame(t.Repr):
         subsystem = buffer[PositionCmd0] & 0x1F
         command_type = (buffer[PositionCmd0] & 0xE0) >> 5
         command_id = buffer[PositionCmd1]
-        data = buffer[DataStart:fcs_position]
+        data = bytes(buffer[DataStart:fcs_position])
         fcs = buffer[fcs_position]
 
         checksum = cls.calculate_checksum(buffer[1:fcs_position])
         if checksum == fcs:
             return cls(command_type, subsystem, command_id, data, length, fcs)
         else:
-            LOGGER.warning("Invalid checksum: 0x%s, data: 0x%s", checksum, buffer)
+            LOGGER.warning(
+                "Invalid checksum: 0x%s, data: 0x%s", checksum, bytes(buffer)
+            )
             return None
 
     @staticmethod
@@ -99,14 +208,32 @@ class UnpiFrame(t.Repr):
         return checksum
 
     def to_buffer(self):
+        buffer = bytearray()
+        self.write_to(buffer)
+        return bytes(buffer)
+
+    def write_to(self, buffer: bytearray):
+        """Append the framed bytes to the end of buffer"""
         length = len(self.data)
         cmd0 = ((self.command_type << 5) & 0xE0) | (self.subsystem & 0x1F)
 
-        res = bytes([SOF, length, cmd0, self.command_id])
-        res += self.data
-        fcs = self.calculate_checksum(res[1:])
+        start = len(buffer)
+        buffer += bytes([SOF, length, cmd0, self.command_id])
+        buffer += self.data
+        with memoryview(buffer) as view:
+            fcs = self.calculate_checksum(view[start + 1 :])
+        buffer.append(fcs)
 
-        return res + bytes([fcs])
+
+class TransmitStats(t.Repr):
+    def __init__(self) -> None:
+        self.frames = 0
+        self.writes = 0
+        self.bytes = 0
+        self.pauses = 0
+        self.queued_bytes = 0
+        self.last_drain_latency = 0.0
+        self.max_drain_latency = 0.0
 
 
 class Gateway(asyncio.Protocol):
@@ -118,50 +245,455 @@ class Gateway(asyncio.Protocol):
         self._api = api
         self._transport = None
         self._open = False
+        self._loop = None
+        self._tx_buffer = bytearray()
+        self._tx_queued_at = None
+        self._tx_flush_handle = None
+        self._tx_paused = False
+        self._partial_handle = None
+        self._drain_waiters: List[asyncio.Future] = []
+        self._handshake = None
+        # handshake pings sent and not answered yet
+        self._handshake_pings = 0
+        self._capture = None
+        self.tx_stats = TransmitStats()
 
     def connection_made(self, transport: serial_asyncio.SerialTransport):
         """Callback when the uart is connected"""
         LOGGER.debug("Connection made")
         self._open = True
         self._transport = transport
+        self._loop = asyncio.get_event_loop()
         if self._connected_future:
             self._connected_future.set_result(True)
 
+    @property
+    def rx_stats(self) -> ParserStats:
+        """Line quality counters of the receive path"""
+        return self._parser.stats
+
+    def start_capture(self, path: str, size: int):
+        """Record every sent frame and all received bytes into a ring file"""
+        self.stop_capture()
+        self._capture = capture.RingCapture(path, size)
+        LOGGER.info("Capturing frames to %s", path)
+
+    def stop_capture(self):
+        if self._capture is not None:
+            self._capture.close()
+            self._capture = None
+
     def close(self):
         self._open = False
+        self._cancel_flush()
+        self._cancel_partial()
+        if self._tx_buffer:
+            self._write_queued()
         self._transport.close()
+        self.stop_capture()
+        self._wake_drain()
+
+    @property
+    def writable(self) -> bool:
+        """Whether the send queue is below its high-water mark"""
+        return len(self._tx_buffer) <= SEND_HIGH_WATER
+
+    async def drain(self):
+        """Wait until the send queue is back below its high-water mark"""
+        if self.writable or not self._open:
+            return
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        future = self._loop.create_future()
+        self._drain_waiters.append(future)
+        await future
+
+    def _wake_drain(self):
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)
+
+    def _start_queue(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        self._tx_queued_at = self._loop.time()
 
     def write(self, data):
-        self._transport.write(data)
+        """Write raw bytes right away, behind the frames still queued"""
+        if not self._tx_buffer:
+            self._start_queue()
+        self._tx_buffer += data
+        if self._capture is not None:
+            self._capture.write(capture.TX, data)
+        self.tx_stats.queued_bytes = len(self._tx_buffer)
+        if not self._tx_paused:
+            self._cancel_flush()
+            self._write_queued()
 
     def send(self, frame: UnpiFrame):
-        """Send data, taking care of escaping and framing"""
-        data = frame.to_buffer()
-        LOGGER.debug("Send: %s", data)
+        """Queue a frame, frames queued in the same loop iteration are written
+        to the transport in a single write"""
+        buffer = self._tx_buffer
+        if not buffer:
+            self._start_queue()
+
+        start = len(buffer)
+        frame.write_to(buffer)
+        if self._capture is not None:
+            self._capture.write(capture.TX, buffer[start:])
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug("Send: %s", bytes(buffer[start:]))
+
+        self.tx_stats.frames += 1
+        self.tx_stats.queued_bytes = len(buffer)
+        if self._tx_flush_handle is None and not self._tx_paused:
+            self._tx_flush_handle = self._loop.call_soon(self._flush)
+
+    def _cancel_flush(self):
+        if self._tx_flush_handle is not None:
+            self._tx_flush_handle.cancel()
+            self._tx_flush_handle = None
+
+    def _flush(self):
+        self._tx_flush_handle = None
+        if self._tx_paused or not self._tx_buffer or self._transport is None:
+            return
+        self._write_queued()
+
+    def _write_queued(self):
+        data = bytes(self._tx_buffer)
+        self._tx_buffer.clear()
+
+        stats = self.tx_stats
+        latency = self._loop.time() - self._tx_queued_at
+        stats.last_drain_latency = latency
+        stats.max_drain_latency = max(stats.max_drain_latency, latency)
+        stats.queued_bytes = 0
+        stats.writes += 1
+        stats.bytes += len(data)
+
         self._transport.write(data)
+        if self._drain_waiters:
+            self._wake_drain()
+
+    async def skip_bootloader(
+        self, timeout=BOOTLOADER_TIMEOUT, interval=HANDSHAKE_INTERVAL
+    ) -> bool:
+        """Skip the serial bootloader and ping the ZNP until it answers
+
+        Returns False when there was no answer before the timeout, which is
+        the same wait the bootloader skip has always needed.
+        """
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        loop = self._loop
+        deadline = loop.time() + timeout
+        self._handshake = loop.create_future()
+        self._handshake_pings = 0
+
+        self.write(b"\xef")
+        try:
+            while not self._handshake.done():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    LOGGER.debug("No ping response within %ss", timeout)
+                    return False
+                self.send(UnpiFrame(t.CommandType.SREQ, t.Subsystem.SYS, 1, b""))
+                self._handshake_pings += 1
+                await asyncio.wait({self._handshake}, timeout=min(interval, remaining))
+
+            # answers to earlier pings may still be on their way, they must not
+            # be taken for the answer to the first ping of the application;
+            # pings sent while the bootloader was running are never answered
+            deadline = loop.time() + interval
+            while self._handshake_pings > 0 and loop.time() < deadline:
+                self._handshake = loop.create_future()
+                await asyncio.wait({self._handshake}, timeout=deadline - loop.time())
+            return True
+        finally:
+            if not self._handshake.done():
+                self._handshake.cancel()
+            self._handshake = None
+
+    def pause_writing(self):
+        """Callback when the transport buffer is over its high-water mark"""
+        LOGGER.debug("Pause writing")
+        self._tx_paused = True
+        self.tx_stats.pauses += 1
+        self._cancel_flush()
+
+    def resume_writing(self):
+        """Callback when the transport buffer drained below its low-water mark"""
+        LOGGER.debug("Resume writing")
+        self._tx_paused = False
+        self._flush()
+
+    def pause_reading(self):
+        """Stop reading from the adapter until resume_reading"""
+        # the line is not quiet, we just stopped listening
+        self._cancel_partial()
+        if self._transport is not None:
+            self._transport.pause_reading()
+
+    def resume_reading(self):
+        if self._transport is not None:
+            self._transport.resume_reading()
+            self._watch_partial()
 
     def data_received(self, data):
         """Callback when there is data received from the uart"""
+        self._record_received(data)
 
-        found = False
-        for b in data:
-            frame = self._parser.write(b)
-            if frame is not None:
-                found = True
-                LOGGER.debug("Frame received: %s", frame)
-                self._api.data_received(frame)
-
-        if not found:
+        frames = self._parser.write(data)
+        self._watch_partial()
+        if frames:
+            self.frames_received(frames)
+        else:
             LOGGER.info("Bytes received: %s", data)
 
+    def _cancel_partial(self):
+        if self._partial_handle is not None:
+            self._partial_handle.cancel()
+            self._partial_handle = None
+
+    def _watch_partial(self):
+        # restarted by every chunk, it only fires once the line went quiet
+        self._cancel_partial()
+        if self._parser.buffer and self._loop is not None:
+            self._partial_handle = self._loop.call_later(
+                PARTIAL_FRAME_TIMEOUT, self._partial_timeout
+            )
+
+    def _partial_timeout(self):
+        self._partial_handle = None
+        frames = self._parser.skip_partial()
+        self._watch_partial()
+        if frames:
+            self.frames_received(frames)
+
+    def _record_received(self, data):
+        # raw bytes, so garbage and corrupted frames end up in the capture too
+        if self._capture is not None:
+            self._capture.write(capture.RX, data)
+
+    def frames_received(self, frames: List[UnpiFrame]):
+        """Callback with the frames parsed from received data"""
+        if self._handshake is not None:
+            frames = [f for f in frames if not self._handshake_response(f)]
+            if not frames:
+                return
+
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            for frame in frames:
+                LOGGER.debug("Frame received: %s", frame)
+        self._api.frames_received(frames)
+
+    def _handshake_response(self, frame: UnpiFrame) -> bool:
+        if (
+            frame.command_type != t.CommandType.SRSP
+            or frame.subsystem != t.Subsystem.SYS
+            or frame.command_id != 1
+        ):
+            return False
+        self._handshake_pings -= 1
+        if not self._handshake.done():
+            self._handshake.set_result(True)
+        return True
+
     def connection_lost(self, exc):
+        self.stop_capture()
+        self._cancel_flush()
+        self._cancel_partial()
+        self._tx_buffer.clear()
+        self.tx_stats.queued_bytes = 0
+        self._wake_drain()
         if self._open:
             LOGGER.error("Serial port closed unexpectedly: %s", exc)
             self._api.connection_lost()
 
 
+class ThreadedSerialTransport(asyncio.Transport):
+    """Serial transport doing all port I/O and frame parsing on its own threads
+
+    The reader thread owns the protocol's Parser and hands complete frames to
+    the event loop in batches, so bytes keep being drained from the port while
+    the loop is busy.
+    """
+
+    def __init__(self, loop, protocol: Gateway, serial_instance: serial.Serial):
+        super().__init__()
+        self._loop = loop
+        self._protocol = protocol
+        self._serial = serial_instance
+        self._closing = False
+        self._reading = threading.Event()
+        self._reading.set()
+
+        self._frames = collections.deque()
+        self._wakeup_scheduled = False
+
+        self._write_queue = queue.SimpleQueue()
+        self._write_lock = threading.Lock()
+        self._write_buffer_size = 0
+        self._high_water = WRITE_HIGH_WATER
+        self._low_water = WRITE_HIGH_WATER // 4
+        self._protocol_paused = False
+
+        self._reader = threading.Thread(
+            target=self._read_loop, name="zigpy-cc serial reader", daemon=True
+        )
+        self._writer = threading.Thread(
+            target=self._write_loop, name="zigpy-cc serial writer", daemon=True
+        )
+
+    def start(self):
+        self._protocol.connection_made(self)
+        self._writer.start()
+        self._reader.start()
+
+    def get_extra_info(self, name, default=None):
+        if name == "serial":
+            return self._serial
+        return default
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._reading.set()
+        self._write_queue.put(None)
+        try:
+            self._serial.cancel_read()
+        except (AttributeError, serial.SerialException):
+            pass
+
+    def abort(self):
+        self.close()
+
+    def pause_reading(self):
+        self._reading.clear()
+
+    def resume_reading(self):
+        self._reading.set()
+
+    def is_reading(self) -> bool:
+        return self._reading.is_set()
+
+    def get_write_buffer_size(self) -> int:
+        return self._write_buffer_size
+
+    def write(self, data):
+        if self._closing:
+            return
+        with self._write_lock:
+            self._write_buffer_size += len(data)
+            size = self._write_buffer_size
+        self._write_queue.put(data)
+        if size > self._high_water and not self._protocol_paused:
+            self._protocol_paused = True
+            self._protocol.pause_writing()
+
+    def _maybe_resume_protocol(self):
+        if self._protocol_paused and self._write_buffer_size <= self._low_water:
+            self._protocol_paused = False
+            self._protocol.resume_writing()
+
+    def _write_loop(self):
+        while True:
+            data = self._write_queue.get()
+            if data is None:
+                return
+            try:
+                self._serial.write(data)
+            except serial.SerialException as exc:
+                LOGGER.debug("Serial write failed: %s", exc)
+                self.close()
+                return
+            with self._write_lock:
+                self._write_buffer_size -= len(data)
+            if self._protocol_paused:
+                self._loop.call_soon_threadsafe(self._maybe_resume_protocol)
+
+    def _read_loop(self):
+        parser = self._protocol._parser
+        exc = None
+        try:
+            while not self._closing:
+                self._reading.wait()
+                data = self._serial.read(self._serial.in_waiting or 1)
+                if not data:
+                    # read timed out, the line is quiet
+                    if parser.buffer:
+                        frames = parser.skip_partial()
+                        if frames:
+                            self._hand_off(None, frames)
+                    continue
+                frames = parser.write(data)
+                # the raw bytes are only needed on the loop for the capture
+                if self._protocol._capture is None:
+                    data = None
+                if frames or data is not None:
+                    self._hand_off(data, frames)
+        except serial.SerialException as e:
+            exc = e
+        finally:
+            self._closing = True
+            self._write_queue.put(None)
+            self._writer.join()
+            self._serial.close()
+            try:
+                self._loop.call_soon_threadsafe(self._protocol.connection_lost, exc)
+            except RuntimeError:
+                # event loop already closed
+                pass
+
+    def _hand_off(self, data, frames):
+        # Runs on the reader thread. Appending before checking the flag means
+        # the loop either sees these frames in a running _deliver or gets woken
+        self._frames.append((data, frames))
+        if not self._wakeup_scheduled:
+            self._wakeup_scheduled = True
+            self._loop.call_soon_threadsafe(self._deliver)
+
+    def _deliver(self):
+        self._wakeup_scheduled = False
+        frames = []
+        pending = self._frames
+        while pending:
+            data, chunk_frames = pending.popleft()
+            if data is not None:
+                self._protocol._record_received(data)
+            frames += chunk_frames
+        if frames and not self._closing:
+            self._protocol.frames_received(frames)
+
+
+async def create_threaded_serial_connection(
+    loop, protocol_factory, url, **kwargs
+) -> ThreadedSerialTransport:
+    """Open the port off the loop and start its I/O threads"""
+    serial_instance = await loop.run_in_executor(
+        None,
+        functools.partial(
+            serial.serial_for_url, url, timeout=SERIAL_READ_TIMEOUT, **kwargs
+        ),
+    )
+    transport = ThreadedSerialTransport(loop, protocol_factory(), serial_instance)
+    transport.start()
+    return transport
+
+
+def list_ports() -> List[ListPortInfo]:
+    """All serial ports that look like a TI CC device"""
+    return sorted(serial.tools.list_ports.grep(usb_regexp), key=lambda d: d.device)
+
+
 def detect_port() -> ListPortInfo:
-    devices = list(serial.tools.list_ports.grep(usb_regexp))
+    devices = list_ports()
     if len(devices) < 1:
         raise serial.SerialException("Unable to find TI CC device using auto mode")
     if len(devices) > 1:
@@ -173,6 +705,20 @@ def detect_port() -> ListPortInfo:
     return devices[0]
 
 
+def is_socket_url(port: str) -> bool:
+    return urllib.parse.urlparse(port).scheme in SOCKET_SCHEMES
+
+
+def _tune_socket(transport):
+    """Disable Nagle and enable keepalive so frames leave immediately and a
+    dead remote bridge is noticed"""
+    sock = transport.get_extra_info("socket")
+    if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+
 async def connect(config: Dict[str, Any], api, loop=None) -> Gateway:
     if loop is None:
         loop = asyncio.get_event_loop()
@@ -186,27 +732,44 @@ async def connect(config: Dict[str, Any], api, loop=None) -> Gateway:
         LOGGER.info("Auto select TI CC device: %s", device)
         port = device.device
 
-    xonxoff, rtscts = False, False
-    if config[CONF_FLOW_CONTROL] == "hardware":
-        xonxoff, rtscts = False, True
-    elif config[CONF_FLOW_CONTROL] == "software":
-        xonxoff, rtscts = True, False
-
-    LOGGER.debug("Connecting on port %s with boudrate %d", port, baudrate)
-    _, protocol = await serial_asyncio.create_serial_connection(
-        loop,
-        lambda: protocol,
-        url=port,
-        baudrate=baudrate,
-        parity=serial.PARITY_NONE,
-        stopbits=serial.STOPBITS_ONE,
-        xonxoff=xonxoff,
-        rtscts=rtscts,
-    )
+    if is_socket_url(port):
+        url = urllib.parse.urlparse(port)
+        LOGGER.debug("Connecting to %s:%d", url.hostname, url.port)
+        transport, _ = await loop.create_connection(
+            lambda: protocol, url.hostname, url.port
+        )
+        _tune_socket(transport)
+    else:
+        xonxoff, rtscts = False, False
+        if config[CONF_FLOW_CONTROL] == "hardware":
+            xonxoff, rtscts = False, True
+        elif config[CONF_FLOW_CONTROL] == "software":
+            xonxoff, rtscts = True, False
+
+        create_serial_connection = serial_asyncio.create_serial_connection
+        if config[CONF_SERIAL_THREAD]:
+            create_serial_connection = create_threaded_serial_connection
+
+        LOGGER.debug("Connecting on port %s with boudrate %d", port, baudrate)
+        await create_serial_connection(
+            loop,
+            lambda: protocol,
+            url=port,
+            baudrate=baudrate,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            xonxoff=xonxoff,
+            rtscts=rtscts,
+        )
 
     await connected_future
 
-    protocol.write(b"\xef")
-    await asyncio.sleep(1)
+    if config[CONF_CAPTURE_PATH]:
+        try:
+            protocol.start_capture(config[CONF_CAPTURE_PATH], config[CONF_CAPTURE_SIZE])
+        except (OSError, ValueError) as exc:
+            LOGGER.error("Not capturing serial traffic: %s", exc)
+
+    await protocol.skip_bootloader()
 
     return protocol
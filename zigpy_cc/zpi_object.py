@@ -1,27 +1,53 @@
+from typing import Dict, Optional, Tuple
+
 from zigpy.profiles import zha
 from zigpy.types import BroadcastAddress
 
 from zigpy_cc import uart
-from zigpy_cc.buffalo import Buffalo, BuffaloOptions
+from zigpy_cc.codec import get_codec
 from zigpy_cc.definition import Definition
-from zigpy_cc.types import CommandType, ParameterType, Subsystem, AddressMode
-
-BufferAndListTypes = [
-    ParameterType.BUFFER,
-    ParameterType.BUFFER8,
-    ParameterType.BUFFER16,
-    ParameterType.BUFFER18,
-    ParameterType.BUFFER32,
-    ParameterType.BUFFER42,
-    ParameterType.BUFFER100,
-    ParameterType.LIST_UINT16,
-    ParameterType.LIST_ROUTING_TABLE,
-    ParameterType.LIST_BIND_TABLE,
-    ParameterType.LIST_NEIGHBOR_LQI,
-    ParameterType.LIST_NETWORK,
-    ParameterType.LIST_ASSOC_DEV,
-    ParameterType.LIST_UINT8,
-]
+from zigpy_cc.types import CommandType, Subsystem, AddressMode
+
+# Definition compiled once into lookup tables. Names and IDs are only unique
+# within a subsystem (getDeviceInfo, resetReq... exist in several), and the
+# first definition wins, like the linear scans these replace did.
+_by_name: Dict[Tuple[int, str], dict] = {}
+_by_id: Dict[Tuple[int, int], dict] = {}
+_by_id_and_type: Dict[Tuple[int, int, int], dict] = {}
+
+
+def _compile_definition() -> None:
+    for subsystem, commands in Definition.items():
+        subsystem = int(subsystem)
+        for cmd in commands:
+            _by_name.setdefault((subsystem, cmd["name"]), cmd)
+            _by_id.setdefault((subsystem, cmd["ID"]), cmd)
+            _by_id_and_type.setdefault((subsystem, cmd["ID"], int(cmd["type"])), cmd)
+            if cmd["type"] == CommandType.SREQ:
+                # the response frame of an SREQ is an SRSP with the same ID
+                key = (subsystem, cmd["ID"], int(CommandType.SRSP))
+                _by_id_and_type.setdefault(key, cmd)
+
+
+_compile_definition()
+
+
+def get_command(subsystem, name: str) -> Optional[dict]:
+    return _by_name.get((int(subsystem), name))
+
+
+def get_command_by_id(subsystem, command_id: int, command_type=None) -> Optional[dict]:
+    if command_type is not None:
+        cmd = _by_id_and_type.get((int(subsystem), command_id, int(command_type)))
+        if cmd is not None:
+            return cmd
+    return _by_id.get((int(subsystem), command_id))
+
+
+def _lookup(cmd: Optional[dict], subsystem, command) -> dict:
+    if cmd is None:
+        raise KeyError("Unknown command {} {}".format(subsystem, command))
+    return cmd
 
 
 class ZpiObject:
@@ -43,25 +69,34 @@ class ZpiObject:
         self.parameters = parameters
         self.sequence = sequence
 
+    def copy(self) -> "ZpiObject":
+        """Copy whose attributes and payload can be changed without affecting
+        this object"""
+        payload = self.payload
+        if isinstance(payload, dict):
+            payload = dict(payload)
+        return type(self)(
+            self.command_type,
+            self.subsystem,
+            self.command,
+            self.command_id,
+            payload,
+            self.parameters,
+            self.sequence,
+        )
+
     def is_reset_command(self):
         return (self.command == "resetReq" and self.subsystem == Subsystem.SYS) or (
             self.command == "systemReset" and self.subsystem == Subsystem.SAPI
         )
 
     def to_unpi_frame(self):
-        data = Buffalo(b"")
-
-        for p in self.parameters:
-            value = self.payload[p["name"]]
-            data.write_parameter(p["parameterType"], value, {})
-
-        return uart.UnpiFrame(
-            self.command_type, self.subsystem, self.command_id, data.buffer
-        )
+        data = get_codec(self.parameters).encode(self.payload)
+        return uart.UnpiFrame(self.command_type, self.subsystem, self.command_id, data)
 
     @classmethod
     def from_command(cls, subsystem, command, payload):
-        cmd = next(c for c in Definition[subsystem] if c["name"] == command)
+        cmd = _lookup(get_command(subsystem, command), subsystem, command)
         parameters = (
             cmd["response"] if cmd["type"] == CommandType.SRSP else cmd["request"]
         )
@@ -70,15 +105,17 @@ class ZpiObject:
 
     @classmethod
     def from_unpi_frame(cls, frame):
-        cmd = next(
-            c for c in Definition[frame.subsystem] if c["ID"] == frame.command_id
+        cmd = _lookup(
+            get_command_by_id(frame.subsystem, frame.command_id, frame.command_type),
+            frame.subsystem,
+            frame.command_id,
         )
         parameters = (
             cmd["response"]
             if frame.command_type == CommandType.SRSP
             else cmd["request"]
         )
-        payload = cls.read_parameters(frame.data, parameters)
+        payload = get_codec(parameters).decode_lazy(frame.data)
 
         return cls(
             frame.command_type,
@@ -105,13 +142,11 @@ class ZpiObject:
     ):
         if profile == zha.PROFILE_ID:
             subsystem = Subsystem.AF
-            if addr_mode is None:
-                cmd = next(c for c in Definition[subsystem] if c["ID"] == 1)
-            else:
-                cmd = next(c for c in Definition[subsystem] if c["ID"] == 2)
+            command_id = 1 if addr_mode is None else 2
         else:
             subsystem = Subsystem.ZDO
-            cmd = next(c for c in Definition[subsystem] if c["ID"] == cluster)
+            command_id = cluster
+        cmd = _lookup(get_command_by_id(subsystem, command_id), subsystem, command_id)
         name = cmd["name"]
         parameters = (
             cmd["response"] if cmd["type"] == CommandType.SRSP else cmd["request"]
@@ -165,33 +200,7 @@ class ZpiObject:
 
     @classmethod
     def read_parameters(cls, data: bytes, parameters):
-        # print(parameters)
-        buffalo = Buffalo(data)
-        res = {}
-        length = None
-        start_index = None
-        for p in parameters:
-            options = BuffaloOptions()
-            name = p["name"]
-            param_type = p["parameterType"]
-            if param_type in BufferAndListTypes:
-                if isinstance(length, int):
-                    options.length = length
-
-                if param_type == ParameterType.LIST_ASSOC_DEV:
-                    if isinstance(start_index, int):
-                        options.startIndex = start_index
-
-            res[name] = buffalo.read_parameter(name, param_type, options)
-
-            # For LIST_ASSOC_DEV, we need to grab the start_index which is
-            # right before the length
-            start_index = length
-            # When reading a buffer, assume that the previous parsed parameter
-            # contains the length of the buffer
-            length = res[name]
-
-        return res
+        return get_codec(parameters).decode(data)
 
     def __repr__(self) -> str:
         command_type = CommandType(self.command_type).name